@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import sys
+from dataclasses import asdict, dataclass, field, replace
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping, Sequence
+
+    from course_tools.data import Database
+    from course_tools.input import InputKind
+    from course_tools.manifest import ManifestEntry
+
+
+from . import manifest
+from .files import write_cache_file
+
+
+# bump when the format or contents of TermSummary change, to invalidate
+# cached ones
+ARCHIVE_CACHE_VERSION = 2
+
+# grade book columns that hold information about the student rather than
+# assignment scores
+NON_ASSIGNMENT_COLUMNS = frozenset({
+    # Moodle
+    "First name", "Last name", "ID number", "Institution", "Department",
+    "Email address", "Username", "Last downloaded from this course",
+    # Relate
+    "user_name", "first_name", "last_name",
+    })
+
+
+# {{{ manifest
+
+@dataclass(frozen=True)
+class TermSpec:
+    name: str
+    course_rules: str
+    inputs: Sequence[tuple[InputKind, str]] = ()
+    # keyword arguments to course_tools.query.apply_limits
+    limits: Mapping[str, Any] = field(default_factory=dict)
+    # grade book columns to summarize, or *None* for all assignment columns
+    assignments: Sequence[str] | None = None
+
+
+def _parse_term(entry: ManifestEntry) -> TermSpec:
+    return TermSpec(
+        name=entry.name,
+        course_rules=entry.course_rules,
+        inputs=entry.inputs,
+        limits=entry.limits,
+        assignments=entry.options.pop("assignments", None))
+
+
+def read_archive_manifest(filename: str) -> list[TermSpec]:
+    """Read an archive manifest, a JSON file of the form::
+
+        {
+            "terms": [
+                {
+                    "name": "fa23",
+                    "course_rules": "fa23/rules.py",
+                    "moodle_csv": ["fa23/gradebook.csv"],
+                    "my_cs_html_roster": ["fa23/roster.html"],
+                    "remove_students_without_section": true,
+                    "assignments": ["HW1 (Real)", "Exam (Real)"]
+                }
+            ]
+        }
+
+    See :func:`course_tools.manifest.read_manifest` for the inputs and
+    limits. ``assignments`` optionally names the grade book columns to
+    summarize. Terms are reported in the order in which they are listed.
+    """
+    return manifest.read_manifest(filename, "term", _parse_term)
+
+# }}}
+
+
+# {{{ per-term reduction
+
+@dataclass(frozen=True)
+class Statistics:
+    n: int
+    mean: float
+    std: float
+    min: float
+    p10: float
+    p25: float
+    median: float
+    p75: float
+    p90: float
+    max: float
+
+
+def get_statistics(values: Sequence[float]) -> Statistics | None:
+    if not values:
+        return None
+
+    import numpy as np
+    ary = np.array(values, dtype=np.float64)
+    p10, p25, median, p75, p90 = np.percentile(ary, [10, 25, 50, 75, 90])
+    return Statistics(
+        n=len(ary),
+        mean=float(np.mean(ary)),
+        std=float(np.std(ary)),
+        min=float(np.min(ary)),
+        p10=float(p10),
+        p25=float(p25),
+        median=float(median),
+        p75=float(p75),
+        p90=float(p90),
+        max=float(np.max(ary)))
+
+
+@dataclass(frozen=True)
+class TermSummary:
+    name: str
+    nstudents: int
+    letter_grades: Sequence[str]
+    # letter grade -> number of students, only for graded students
+    letter_counts: Mapping[str, int]
+    # scale name -> cutoffs, in the order of letter_grades
+    cutoffs: Mapping[str, Sequence[float]]
+    # of grades in percent
+    grades: Statistics | None
+    sections: Mapping[str, Statistics]
+    # of the numeric values in each assignment column of the grade book
+    assignments: Mapping[str, Statistics]
+
+    @property
+    def ngraded(self) -> int:
+        return sum(self.letter_counts.values())
+
+    def to_json(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Any]) -> TermSummary:
+        def stats(value: Mapping[str, Any] | None) -> Statistics | None:
+            return None if value is None else Statistics(**value)
+
+        return cls(
+            name=data["name"],
+            nstudents=data["nstudents"],
+            letter_grades=data["letter_grades"],
+            letter_counts=data["letter_counts"],
+            cutoffs=data["cutoffs"],
+            grades=stats(data["grades"]),
+            sections={
+                name: Statistics(**value)
+                for name, value in data["sections"].items()},
+            assignments={
+                name: Statistics(**value)
+                for name, value in data["assignments"].items()})
+
+
+def _is_number(value: Any) -> bool:
+    return (isinstance(value, (int, float))
+            and not isinstance(value, bool)
+            and not math.isnan(value))
+
+
+def is_assignment_column(column: str) -> bool:
+    """Guess whether the grade book *column* holds assignment scores. This
+    excludes :data:`NON_ASSIGNMENT_COLUMNS` as well as course and category
+    totals.
+    """
+    return (column not in NON_ASSIGNMENT_COLUMNS
+            and "total" not in column.lower().split())
+
+
+def summarize_term(
+        name: str, database: Database,
+        assignments: Sequence[str] | None = None) -> TermSummary:
+    """Reduce the graded *database* to a :class:`TermSummary`.
+
+    :arg assignments: the grade book columns to summarize. By default, all
+        columns for which :func:`is_assignment_column` holds are used.
+    """
+    course_rules = database.course_rules
+    assert course_rules is not None
+
+    letter_counts: dict[str, int] = {}
+    section_grades: dict[str, list[float]] = {}
+    grades = []
+    assignment_values: dict[str, list[float]] = {}
+
+    for student in database.students.values():
+        if student.letter_grade is not None:
+            letter_counts[student.letter_grade] = (
+                letter_counts.get(student.letter_grade, 0) + 1)
+
+        if student.grade is not None:
+            grades.append(100*student.grade)
+            section_grades.setdefault(
+                student.section or "(none)", []).append(100*student.grade)
+
+        for column, value in student.csv_row.items():
+            if assignments is None:
+                if not is_assignment_column(column):
+                    continue
+            elif column not in assignments:
+                continue
+
+            if _is_number(value):
+                assert value is not None
+                assignment_values.setdefault(column, []).append(value)
+
+    def get_stats_dict(
+            values_dict: Mapping[str, list[float]]) -> dict[str, Statistics]:
+        result = {}
+        for key, values in sorted(values_dict.items()):
+            stats = get_statistics(values)
+            assert stats is not None
+            result[key] = stats
+        return result
+
+    return TermSummary(
+        name=name,
+        nstudents=len(database.students),
+        letter_grades=list(course_rules["LETTER_GRADES"]),
+        letter_counts=letter_counts,
+        cutoffs={
+            scale: list(cutoffs)
+            for scale, cutoffs in sorted(course_rules["SCALE_CUTOFFS"].items())},
+        grades=get_statistics(grades),
+        sections=get_stats_dict(section_grades),
+        assignments=get_stats_dict(assignment_values))
+
+
+def process_term(
+        term: TermSpec,
+        nworkers: int | None = None,
+        input_cache_dir: str | None = None) -> TermSummary:
+    """Read, grade and summarize *term*. Only the students of *term* are
+    held in memory, and only until they are summarized.
+    """
+    from . import input as inp, query as qry
+    from .data import Database
+    from .grade import grade_students
+    from .rules import load_course_rules
+
+    database = Database(load_course_rules(term.course_rules))
+    for (kind, _filename), rows in zip(
+            term.inputs,
+            inp.parse_inputs(term.inputs, nworkers, cache_dir=input_cache_dir),
+            strict=True):
+        inp.merge_input(database, kind, rows)
+
+    database = qry.apply_limits(database, **term.limits)
+    grade_students(database)
+
+    return summarize_term(term.name, database, term.assignments)
+
+# }}}
+
+
+# {{{ summary cache
+
+def _get_summary_cache_file(cache_dir: str, term: TermSpec) -> str:
+    import hashlib
+    from pathlib import Path
+
+    key = hashlib.sha256()
+    key.update(f"{ARCHIVE_CACHE_VERSION}\0".encode())
+    key.update(Path(term.course_rules).read_bytes())
+    for kind, filename in term.inputs:
+        key.update(f"\0{kind}\0".encode())
+        key.update(hashlib.sha256(Path(filename).read_bytes()).digest())
+    key.update(b"\0")
+    key.update(json.dumps(
+        [term.limits, term.assignments], sort_keys=True).encode())
+    return os.path.join(cache_dir, f"{key.hexdigest()}.json")
+
+
+def summarize_terms(
+        terms: Iterable[TermSpec],
+        cache_dir: str | None = None,
+        nworkers: int | None = None,
+        input_cache_dir: str | None = None) -> list[TermSummary]:
+    """Summarize each of *terms* in turn (see :func:`process_term`).
+
+    :arg cache_dir: if given, term summaries are cached in this directory,
+        keyed by the contents of the term's rules and input files, its
+        limits and assignments, so that only new or changed terms are processed.
+    """
+    result = []
+    for term in terms:
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = _get_summary_cache_file(cache_dir, term)
+            try:
+                with open(cache_file, encoding="utf-8") as inf:
+                    summary = TermSummary.from_json(json.load(inf))
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            else:
+                print("%s: cached" % term.name, file=sys.stderr)
+                result.append(replace(summary, name=term.name))
+                continue
+
+        summary = process_term(term, nworkers, input_cache_dir)
+        print("%s: %d students" % (term.name, summary.nstudents), file=sys.stderr)
+        result.append(summary)
+
+        if cache_file is not None:
+            write_cache_file(cache_file, json.dumps(summary.to_json()))
+
+    return result
+
+# }}}
+
+
+# {{{ cross-term report
+
+def _pool_statistics(
+        stats: Iterable[Statistics | None]) -> tuple[int, float, float] | None:
+    """:returns: the number of values, mean and standard deviation of the
+        union of the data sets described by *stats*.
+    """
+    stats = [st for st in stats if st is not None]
+    n = sum(st.n for st in stats)
+    if not n:
+        return None
+
+    mean = sum(st.n*st.mean for st in stats) / n
+    sum_sq = sum(st.n*(st.std**2 + st.mean**2) for st in stats)
+    return n, mean, math.sqrt(max(sum_sq/n - mean**2, 0))
+
+
+def print_term_comparison(summaries: Sequence[TermSummary]) -> None:
+    def print_heading(title: str) -> None:
+        print("-"*75)
+        print(title)
+        print("-"*75)
+
+    names = [summary.name for summary in summaries]
+    name_width = max([len(name) for name in names] + [8])
+
+    print_heading("GRADES (%)")
+    print("%s %6s %6s %6s %6s %6s %6s %6s"
+          % ("term".ljust(name_width), "n", "graded",
+             "mean", "std", "p25", "median", "p75"))
+    for summary in summaries:
+        grades = summary.grades
+        print("%s %6d %6d" % (
+            summary.name.ljust(name_width), summary.nstudents, summary.ngraded), end="")
+        if grades is None:
+            print()
+        else:
+            print(" %6.2f %6.2f %6.2f %6.2f %6.2f" % (
+                grades.mean, grades.std, grades.p25, grades.median, grades.p75))
+
+    pooled = _pool_statistics(summary.grades for summary in summaries)
+    if pooled is not None:
+        ngraded, mean, std = pooled
+        nstudents = sum(summary.nstudents for summary in summaries)
+        print("%s %6d %6d %6.2f %6.2f" % (
+            "all".ljust(name_width), nstudents, ngraded, mean, std))
+
+    letters = list(dict.fromkeys(
+        ltr for summary in summaries for ltr in summary.letter_grades))
+    total_counts = {
+        ltr: sum(summary.letter_counts.get(ltr, 0) for summary in summaries)
+        for ltr in letters}
+    total_graded = sum(total_counts.values())
+
+    def format_share(count: int, total: int) -> str:
+        return "%6.1f" % (100*count/total) if total else "%6s" % "-"
+
+    print_heading("LETTER GRADES (% of graded students)")
+    print("%-6s %s %6s" % (
+        "letter", " ".join("%6s" % name[:6] for name in names), "all"))
+    for ltr in letters:
+        print("%-6s %s %s" % (
+            ltr,
+            " ".join(
+                format_share(summary.letter_counts.get(ltr, 0), summary.ngraded)
+                for summary in summaries),
+            format_share(total_counts[ltr], total_graded)))
+
+    print_heading("CUTOFFS")
+    for summary in summaries:
+        for scale, cutoffs in summary.cutoffs.items():
+            print("%s %-10s %s" % (
+                summary.name.ljust(name_width), scale,
+                " ".join(
+                    "%s:%g" % (ltr, cutoff)
+                    for ltr, cutoff in zip(
+                        summary.letter_grades, cutoffs, strict=False))))
+
+    print_heading("SECTIONS (%)")
+    print("%s %-10s %6s %6s %6s %6s %6s"
+          % ("term".ljust(name_width), "section", "n", "mean", "p25", "median", "p75"))
+    for summary in summaries:
+        for section, stats in summary.sections.items():
+            print("%s %-10s %6d %6.2f %6.2f %6.2f %6.2f" % (
+                summary.name.ljust(name_width), section, stats.n,
+                stats.mean, stats.p25, stats.median, stats.p75))
+
+    assignments = sorted({
+        assignment
+        for summary in summaries for assignment in summary.assignments})
+    assignment_width = max([len(name) for name in assignments] + [10])
+
+    print_heading("ASSIGNMENT MEANS")
+    print("%s %s" % (
+        "assignment".ljust(assignment_width),
+        " ".join("%8s" % name[:8] for name in names)))
+    for assignment in assignments:
+        print("%s %s" % (
+            assignment.ljust(assignment_width),
+            " ".join(
+                "%8.2f" % summary.assignments[assignment].mean
+                if assignment in summary.assignments else "%8s" % "-"
+                for summary in summaries)))
+
+
+def run_archive_manifest(
+        filename: str,
+        cache_dir: str | None = None,
+        nworkers: int | None = None,
+        input_cache_dir: str | None = None) -> None:
+    if cache_dir is None:
+        from .files import get_cache_dir
+        cache_dir = str(get_cache_dir("archive"))
+
+    print_term_comparison(summarize_terms(
+        read_archive_manifest(filename), cache_dir, nworkers, input_cache_dir))
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+    from course_tools.input import InputKind
+    from course_tools.manifest import ManifestEntry
+    from course_tools.report import ReportFormat
+
+
+from . import input as inp, manifest
+from .output import OUTPUT_FORMATS
+from .report import REPORT_FORMATS
+
+
+# outputs other than the ones in OUTPUT_FORMATS, with their file names
+_PRINTED_OUTPUTS = {
+    "scales": "scales.txt",
+    "grade-list": "grade-list.txt",
+    "letter-histogram": "letter-histogram.txt",
+    "warnings": "warnings.txt",
+    "diagnostic-counts": "diagnostic-counts.txt",
+    }
+
+_OTHER_OUTPUTS = {
+    "snapshot": "snapshot.json.gz",
+    "diagnostics-jsonl": "diagnostics.jsonl",
+    "student-reports": "reports",
+    }
+
+BATCH_OUTPUTS = frozenset(OUTPUT_FORMATS) | set(_PRINTED_OUTPUTS) | set(_OTHER_OUTPUTS)
+
+
+# {{{ manifest
+
+@dataclass(frozen=True)
+class CourseSpec:
+    name: str
+    course_rules: str
+    output_dir: str
+    outputs: Sequence[str]
+    inputs: Sequence[tuple[InputKind, str]] = ()
+    # keyword arguments to course_tools.query.apply_limits
+    limits: Mapping[str, Any] = field(default_factory=dict)
+    email_suffix: str = "@illinois.edu"
+    warn_level: int = 4
+    student_report_format: ReportFormat = "txt"
+
+
+def _parse_course(entry: ManifestEntry) -> CourseSpec:
+    options = entry.options
+
+    outputs = options.pop("outputs")
+    unknown_outputs = set(outputs) - BATCH_OUTPUTS
+    if unknown_outputs:
+        raise ValueError(
+            "course '%s': unknown outputs: %s"
+            % (entry.name, ", ".join(sorted(unknown_outputs))))
+
+    student_report_format = options.pop("student_report_format", "txt")
+    if student_report_format not in REPORT_FORMATS:
+        raise ValueError(
+            "course '%s': unknown student report format: %s"
+            % (entry.name, student_report_format))
+
+    return CourseSpec(
+        name=entry.name,
+        course_rules=entry.course_rules,
+        output_dir=entry.resolve(options.pop("output_dir", entry.name)),
+        outputs=outputs,
+        inputs=entry.inputs,
+        limits=entry.limits,
+        email_suffix=options.pop("email_suffix", "@illinois.edu"),
+        warn_level=options.pop("warn_level", 4),
+        student_report_format=student_report_format,
+        )
+
+
+def read_manifest(filename: str) -> list[CourseSpec]:
+    """Read a batch manifest, a JSON file of the form::
+
+        {
+            "courses": [
+                {
+                    "name": "cs450",
+                    "course_rules": "rules-cs450.py",
+                    "moodle_csv": ["gradebook.csv"],
+                    "my_cs_html_roster": ["roster-al1.html", "roster-al2.html"],
+                    "limit_to_section": ["AL1"],
+                    "email_suffix": "@illinois.edu",
+                    "outputs": ["grade-list", "banner-csv", "snapshot"],
+                    "output_dir": "out/cs450"
+                }
+            ]
+        }
+
+    See :func:`course_tools.manifest.read_manifest` for the inputs and
+    limits. ``outputs`` is required as well; ``output_dir`` defaults to
+    ``name``. See :data:`BATCH_OUTPUTS` for the available outputs.
+    """
+    return manifest.read_manifest(filename, "course", _parse_course)
+
+# }}}
+
+
+# {{{ running
+
+# set in each worker process by _init_worker
+_parsed_inputs: Mapping[tuple[InputKind, str], list[Any]] = {}
+
+
+def _init_worker(parsed_inputs: Mapping[tuple[InputKind, str], list[Any]]) -> None:
+    global _parsed_inputs
+    _parsed_inputs = parsed_inputs
+
+
+def run_course(
+        course: CourseSpec,
+        parsed_inputs: Mapping[tuple[InputKind, str], list[Any]]) -> int:
+    """Grade *course* from already parsed inputs and write its outputs to
+    its output directory.
+
+    :returns: the number of students graded.
+    """
+    from contextlib import redirect_stderr, redirect_stdout
+    from copy import deepcopy
+
+    from . import output as out, query as qry
+    from .data import Database
+    from .grade import grade_students
+    from .rules import load_course_rules
+
+    database = Database(load_course_rules(course.course_rules))
+    for kind, filename in course.inputs:
+        # rows end up in the students, whose course rules may modify them
+        inp.merge_input(database, kind, deepcopy(parsed_inputs[kind, filename]))
+
+    os.makedirs(course.output_dir, exist_ok=True)
+
+    def output_path(name: str) -> str:
+        return os.path.join(course.output_dir, name)
+
+    if "scales" in course.outputs:
+        with open(output_path(_PRINTED_OUTPUTS["scales"]), "w",
+                  encoding="utf-8") as outf, redirect_stdout(outf):
+            out.print_scales(database)
+
+    database = qry.apply_limits(database, **course.limits)
+
+    grade_students(database)
+
+    streaming_outputs = [name for name in course.outputs if name in OUTPUT_FORMATS]
+    if streaming_outputs:
+        with open(output_path("output-warnings.txt"), "w",
+                  encoding="utf-8") as errf, redirect_stderr(errf):
+            out.write_outputs(
+                database, streaming_outputs, course.output_dir,
+                email_suffix=course.email_suffix)
+
+    printers = {
+        "grade-list": lambda: out.print_grade_list(database),
+        "letter-histogram": lambda: out.print_letter_histogram(database),
+        "warnings": lambda: out.print_warnings(database, course.warn_level),
+        "diagnostic-counts": lambda: out.print_diagnostic_counts(database),
+        }
+    for name, print_output in printers.items():
+        if name in course.outputs:
+            with open(output_path(_PRINTED_OUTPUTS[name]), "w",
+                      encoding="utf-8") as outf, \
+                    redirect_stdout(outf), redirect_stderr(outf):
+                print_output()
+
+    if "snapshot" in course.outputs:
+        from .snapshot import write_snapshot
+        write_snapshot(database, output_path(_OTHER_OUTPUTS["snapshot"]))
+
+    if "diagnostics-jsonl" in course.outputs:
+        with open(output_path(_OTHER_OUTPUTS["diagnostics-jsonl"]), "w",
+                  encoding="utf-8") as outf:
+            database.diagnostics.write_jsonl(outf)
+
+    if "student-reports" in course.outputs:
+        from .report import write_student_reports
+        write_student_reports(
+            database, output_path(_OTHER_OUTPUTS["student-reports"]),
+            course.student_report_format, nprocs=1)
+
+    return len(database.students)
+
+
+def _run_course_in_worker(course: CourseSpec) -> int:
+    return run_course(course, _parsed_inputs)
+
+
+def run_batch(
+        courses: Sequence[CourseSpec],
+        nworkers: int | None = None,
+        cache_dir: str | None = None) -> dict[str, int | BaseException]:
+    """Run all of *courses*. Each input file used by any of them is parsed
+    only once (see :func:`course_tools.input.parse_inputs` for *cache_dir*).
+    The courses are then graded in parallel in *nworkers* processes.
+
+    :returns: a mapping from course name to the number of students graded,
+        or the exception raised while processing the course.
+    """
+    all_inputs = list(dict.fromkeys(
+        course_input for course in courses for course_input in course.inputs))
+    parsed_inputs = dict(zip(
+        all_inputs,
+        inp.parse_inputs(all_inputs, nworkers, cache_dir=cache_dir),
+        strict=True))
+
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+    nworkers = min(nworkers, len(courses))
+
+    results: dict[str, int | BaseException] = {}
+    if nworkers <= 1:
+        for course in courses:
+            try:
+                results[course.name] = run_course(course, parsed_inputs)
+            except Exception as e:  # ruff:ignore[blind-except]
+                results[course.name] = e
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(
+                nworkers, initializer=_init_worker,
+                initargs=(parsed_inputs,)) as pool:
+            futures = {
+                course.name: pool.submit(_run_course_in_worker, course)
+                for course in courses}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:  # ruff:ignore[blind-except]
+                    results[name] = e
+
+    return results
+
+
+def run_manifest(
+        filename: str,
+        nworkers: int | None = None,
+        cache_dir: str | None = None) -> None:
+    import sys
+
+    courses = read_manifest(filename)
+    results = run_batch(courses, nworkers, cache_dir)
+
+    nfailed = 0
+    for course in courses:
+        result = results[course.name]
+        if isinstance(result, BaseException):
+            nfailed += 1
+            print("*** %s: FAILED: %s: %s"
+                  % (course.name, type(result).__name__, result),
+                  file=sys.stderr)
+        else:
+            print("%s: %d students -> %s"
+                  % (course.name, result, course.output_dir))
+
+    if nfailed:
+        raise RuntimeError("%d of %d courses failed" % (nfailed, len(courses)))
+
+# }}}
+
+# vim: foldmethod=marker
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import pathlib
+from typing import Literal
 
 import typed_argparse as tap
 
 from . import input as inp, output as out, query as qry
 from .data import Database
-from .grade import make_letter_grade
+from .grade import grade_students
+from .rules import load_course_rules
 
 
 class Args(tap.TypedArgs):
@@ -19,9 +20,19 @@ class Args(tap.TypedArgs):
     limit_to_section: list[str] = tap.arg(metavar="SECTION", nargs="+", default=[])
     limit_to_scale: str | None = tap.arg(metavar="SCALE", default=None)
     limit_to_standing: str | None = tap.arg(metavar="STANDING", default=None)
+    roster_snapshot: str | None = tap.arg(
+        metavar="FILENAME", default=None,
+        help="report roster changes since the roster stored in FILENAME, "
+        "then store the current roster there")
     print_scales: bool = tap.arg(default=False)
     print_grade_list: bool = tap.arg("-g", default=False)
     print_student_report: str | None = tap.arg("-s", metavar="NETWORK_ID", default=None)
+    write_student_reports: str | None = tap.arg(metavar="DIR", default=None)
+    student_report_format: Literal["txt", "html", "json"] = tap.arg(default="txt")
+    prune_student_reports: bool = tap.arg(
+        default=False,
+        help="remove reports of students not selected in this run from the "
+        "--write-student-reports directory")
     print_letter_histogram: bool = tap.arg(default=False)
     plot_histogram: bool = tap.arg(default=False)
     histogram_undiff: bool = tap.arg(default=False)
@@ -29,85 +40,161 @@ class Args(tap.TypedArgs):
     print_roster_csv: bool = tap.arg(default=False)
     email_suffix: str = tap.arg(default="@illinois.edu")
     print_banner_csv: bool = tap.arg(default=False)
-    update_banner_xlsx: str | None = tap.arg(metavar="FILENAME", default=None)
+    update_banner_xlsx: list[str] = tap.arg(
+        metavar="FILENAME", nargs="+", default=[])
+    banner_xlsx_streaming: bool = tap.arg(default=False)
     print_relate_csv: bool = tap.arg(default=False)
     print_preliminary_relate_csv: bool = tap.arg(default=False)
     print_relate_not_in_roster_query: bool = tap.arg(default=False)
+    relate_query_chunk_size: int | None = tap.arg(
+        metavar="N", default=None,
+        help="split the not-in-roster query into queries of N students each")
+    relate_participants_csv: list[str] = tap.arg(
+        metavar="CSV", nargs="+", default=[],
+        help="Relate participant export to compare with the roster; only rows "
+        "with role 'student' and status 'active' count, if the export has "
+        "those columns")
+    print_relate_roster_difference: bool = tap.arg(default=False)
     print_warnings: bool = tap.arg(default=False)
+    print_diagnostic_counts: bool = tap.arg(default=False)
+    write_diagnostics_jsonl: str | None = tap.arg(metavar="FILENAME", default=None)
+    output_dir: str | None = tap.arg(
+        metavar="DIR", default=None,
+        help="write emails, roster, Banner and Relate CSV outputs to "
+        "separate files in DIR instead of stdout")
+    compress_output: bool = tap.arg(default=False)
     print_random_group_csv: bool = tap.arg(default=False)
     random_group_size: int = tap.arg(default=6)
+    random_group_seed: int | None = tap.arg(default=None)
+    random_group_balance: Literal["section", "standing", "scale"] | None = tap.arg(
+        default=None)
+    random_group_room_capacity: list[int] = tap.arg(
+        metavar="CAPACITY", nargs="+", default=[],
+        help="assign to one group per room with the given capacities "
+        "instead of groups of --random-group-size")
+    random_group_keep_apart: str | None = tap.arg(
+        metavar="CSV", default=None,
+        help="CSV file of network ID pairs that must be in different groups")
     remove_students_without_section: bool = tap.arg(default=False)
+    jobs: int | None = tap.arg(
+        "-j", default=None,
+        help="number of parallel workers (default: number of CPUs)")
+    input_cache_dir: str | None = tap.arg(
+        metavar="DIR", default=None,
+        help="cache parsed input files in DIR, keyed by their contents")
+    compare_rules: list[str] = tap.arg(
+        metavar="RULES_PY", nargs=2, default=[], auto_default_help=False,
+        help="grade the inputs with the BASELINE and CANDIDATE rules files "
+        "and report differences and per-hook timings")
+    write_snapshot: str | None = tap.arg(metavar="FILENAME", default=None)
+    batch_manifest: str | None = tap.arg(
+        metavar="MANIFEST_JSON", default=None,
+        help="grade all courses listed in MANIFEST_JSON, "
+        "ignoring all other options except --jobs")
+    analyze_archive: str | None = tap.arg(
+        metavar="MANIFEST_JSON", default=None,
+        help="compare grade distributions, cutoffs and assignment statistics "
+        "across the terms listed in MANIFEST_JSON")
+    archive_cache_dir: str | None = tap.arg(
+        metavar="DIR", default=None,
+        help="cache per-term summaries in DIR "
+        "(default: course-tools/archive in the user cache directory)")
+    diff_snapshots: list[str] = tap.arg(
+        metavar="SNAPSHOT", nargs=2, default=[], auto_default_help=False,
+        help="report grading changes between the OLD and NEW snapshot files")
 
 
 def run(args: Args):
+    if args.diff_snapshots:
+        from .snapshot import print_snapshot_diff, read_snapshot
+        old_filename, new_filename = args.diff_snapshots
+        print_snapshot_diff(
+            read_snapshot(old_filename), read_snapshot(new_filename))
+        return
+
+    if args.batch_manifest:
+        from .batch import run_manifest
+        run_manifest(args.batch_manifest, args.jobs, args.input_cache_dir)
+        return
+
+    if args.analyze_archive:
+        from .archive import run_archive_manifest
+        run_archive_manifest(
+            args.analyze_archive, args.archive_cache_dir,
+            args.jobs, args.input_cache_dir)
+        return
+
     # {{{ frontend
 
+    inputs: list[tuple[inp.InputKind, str]] = [
+        *[("moodle_csv", csv_name) for csv_name in args.moodle_csv or []],
+        *[("relate_csv", csv_name) for csv_name in args.relate_csv or []],
+        *[("my_cs_html_roster", html_name)
+            for html_name in args.my_cs_html_roster or []],
+        ]
+
+    if args.compare_rules:
+        from .regress import compare_rules, print_rules_comparison
+        baseline_rules, candidate_rules = args.compare_rules
+        print_rules_comparison(*compare_rules(
+            baseline_rules, candidate_rules, inputs,
+            limits={
+                "has_section": args.remove_students_without_section,
+                "sections": args.limit_to_section,
+                "standing": args.limit_to_standing,
+                "scale": args.limit_to_scale,
+                },
+            nworkers=args.jobs, cache_dir=args.input_cache_dir))
+        return
+
     if args.course_rules is None:
         raise RuntimeError("course rules module needed")
 
-    course_rules = {}
-    rules_file_contents = pathlib.Path(args.course_rules).read_text()
-
-    exec(compile(rules_file_contents, args.course_rules, "exec"), course_rules)  # ruff:ignore[exec-builtin]
+    database = Database(load_course_rules(args.course_rules))
 
-    database = Database(course_rules)
+    inp.read_inputs(
+        database, inputs, args.jobs, cache_dir=args.input_cache_dir)
 
-    if args.moodle_csv:
-        for csv_name in args.moodle_csv:
-            inp.read_moodle_csv(database, csv_name)
-
-    if args.relate_csv:
-        for csv_name in args.relate_csv:
-            inp.read_relate_csv(database, csv_name)
+    # }}}
 
-    if args.my_cs_html_roster:
-        for html_name in args.my_cs_html_roster:
-            inp.read_my_engr_html_roster(database, html_name)
+    if args.roster_snapshot:
+        if not args.my_cs_html_roster:
+            raise RuntimeError("--roster-snapshot needs --my-cs-html-roster")
 
-    # }}}
+        from .roster import (
+            RosterSnapshotStore,
+            print_roster_delta,
+            roster_from_database,
+        )
+        roster = roster_from_database(database)
+        print_roster_delta(
+            RosterSnapshotStore(args.roster_snapshot).ingest(roster), roster)
 
     if args.print_scales:
         out.print_scales(database)
 
-    if args.remove_students_without_section:
-        database = qry.limit_to_has_section(database)
-
-    if args.limit_to_section:
-        database = qry.limit_to_section(database, args.limit_to_section)
-
-    if args.limit_to_standing:
-        database = qry.limit_to_standing(database, args.limit_to_standing)
-
-    if args.limit_to_scale:
-        database = qry.limit_to_scale(database, args.limit_to_scale)
-
-    # {{{ grading loop
-
-    for student in database.students.values():
-        log = student.__dict__.setdefault("log", [])
-
-        def add_log(severity, msg):
-            """severity: 0-5"""
-            log.append((severity, msg))  # ruff:ignore[function-uses-loop-variable]
+    database = qry.apply_limits(
+        database,
+        has_section=args.remove_students_without_section,
+        sections=args.limit_to_section,
+        standing=args.limit_to_standing,
+        scale=args.limit_to_scale)
 
-        grade = database.course_rules["MAKE_GRADE"](student, add_log)
-        student.set_attribute("grade", grade)
+    grade_students(database)
 
-        if grade is not None:
-            rounded_grade = round(100*grade)
-            letter_grade = make_letter_grade(database, student, add_log)
-        else:
-            rounded_grade = None
-            letter_grade = None
-
-        student.set_attribute("rounded_grade", rounded_grade)
-        student.set_attribute("letter_grade", letter_grade)
-
-    # }}}
+    if args.write_snapshot:
+        from .snapshot import write_snapshot
+        write_snapshot(database, args.write_snapshot)
 
     if args.print_student_report:
         out.print_student_report(database, args.print_student_report)
 
+    if args.write_student_reports:
+        out.write_student_reports(
+            database, args.write_student_reports,
+            args.student_report_format, args.jobs,
+            prune=args.prune_student_reports)
+
     if args.print_grade_list:
         out.print_warnings(database, args.warn_level)
         out.print_grade_list(database)
@@ -118,33 +205,78 @@ def run(args: Args):
     if args.print_letter_histogram:
         out.print_letter_histogram(database)
 
-    if args.print_emails:
-        out.print_emails(database, args.email_suffix)
-
-    if args.print_roster_csv:
-        out.print_roster_csv(database)
-
-    if args.print_banner_csv:
-        out.print_banner_csv(database)
+    output_flags = {
+        "emails": args.print_emails,
+        "roster-csv": args.print_roster_csv,
+        "banner-csv": args.print_banner_csv,
+        "relate-csv": args.print_relate_csv,
+        "preliminary-relate-csv": args.print_preliminary_relate_csv,
+        }
+
+    if args.output_dir:
+        output_names = [name for name, flag in output_flags.items() if flag]
+        if output_names:
+            out.write_outputs(
+                database, output_names, args.output_dir,
+                email_suffix=args.email_suffix,
+                compress=args.compress_output)
+    else:
+        if args.print_emails:
+            out.print_emails(database, args.email_suffix)
+
+        if args.print_roster_csv:
+            out.print_roster_csv(database)
+
+        if args.print_banner_csv:
+            out.print_banner_csv(database)
+
+        if args.print_relate_csv:
+            out.print_relate_csv(database)
+
+        if args.print_preliminary_relate_csv:
+            out.print_preliminary_relate_csv(database)
 
     if args.update_banner_xlsx:
-        out.update_banner_xlsx(database, args.update_banner_xlsx)
+        out.update_banner_xlsx(
+            database, args.update_banner_xlsx,
+            streaming=args.banner_xlsx_streaming)
 
-    if args.print_relate_csv:
-        out.print_relate_csv(database)
+    if args.print_relate_not_in_roster_query:
+        out.print_relate_not_in_roster_query(
+            database, args.email_suffix, args.relate_query_chunk_size)
 
-    if args.print_preliminary_relate_csv:
-        out.print_preliminary_relate_csv(database)
+    if args.print_relate_roster_difference:
+        if not args.relate_participants_csv:
+            raise RuntimeError("--relate-participants-csv needed")
 
-    if args.print_relate_not_in_roster_query:
-        out.print_relate_not_in_roster_query(database, args.email_suffix)
+        relate_database = Database(database.course_rules)
+        for csv_name in args.relate_participants_csv:
+            inp.read_relate_csv(relate_database, csv_name)
+
+        out.print_relate_roster_difference(
+            database, relate_database, args.email_suffix)
 
     if args.print_random_group_csv:
-        out.print_random_group_csv(database, args.random_group_size)
+        from .groups import read_keep_apart_csv
+        out.print_random_group_csv(
+            database, args.random_group_size, args.email_suffix,
+            seed=args.random_group_seed,
+            balance=args.random_group_balance,
+            room_capacities=args.random_group_room_capacity or None,
+            keep_apart=(
+                read_keep_apart_csv(args.random_group_keep_apart)
+                if args.random_group_keep_apart else ()))
 
     if args.print_warnings:
         out.print_warnings(database, args.warn_level)
 
+    if args.print_diagnostic_counts:
+        out.print_diagnostic_counts(database)
+
+    if args.write_diagnostics_jsonl:
+        with open(args.write_diagnostics_jsonl, "w", encoding="utf-8") as outf:
+            database.diagnostics.write_jsonl(outf)
+
 
 def main():
     tap.Parser(Args).bind(run).run()
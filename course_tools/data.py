@@ -7,6 +7,8 @@ from typing import TYPE_CHECKING, Any
 if TYPE_CHECKING:
     from collections.abc import Mapping
 
+from .diagnostics import Diagnostics
+
 
 _no_value = object()
 
@@ -27,8 +29,6 @@ class Student:
     rounded_grade: int | None = None
     letter_grade: str | None = None
 
-    log: list[str] = field(default_factory=list)
-
     def set_attribute(self, name: str, value: Any):
         old_value = getattr(self, name, _no_value)
 
@@ -56,10 +56,15 @@ class Database:
     """
     .. attribute:: students
     .. attribute:: course_rules
+    .. attribute:: diagnostics
+
+        A :class:`~course_tools.diagnostics.Diagnostics` holding the
+        messages logged while grading.
     """
 
     course_rules: dict | None = None
     students: dict[str, Student] = field(default_factory=dict)
+    diagnostics: Diagnostics = field(default_factory=Diagnostics)
 
     def get_student(self, network_id):
         assert network_id == network_id.lower()
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import heapq
+import json
+from array import array
+from typing import TYPE_CHECKING, Any, NamedTuple, TextIO
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+
+class Diagnostic(NamedTuple):
+    network_id: str
+    severity: float
+    template: str
+    args: tuple[Any, ...]
+
+    @property
+    def message(self) -> str:
+        if self.args:
+            return self.template % self.args
+        else:
+            return self.template
+
+
+def _to_severity(value: float) -> float:
+    return int(value) if float(value).is_integer() else value
+
+
+class Diagnostics:
+    """A central store of grading diagnostics (the student "log").
+
+    Each entry has a severity (0-5), a message template and arguments for
+    it, so that messages are only formatted when needed. Entries are stored
+    column-wise, with templates and network IDs interned, and indexed by
+    severity and student. Each distinct template is a "category" for the
+    purpose of :meth:`get_category_counts`.
+    """
+
+    def __init__(self) -> None:
+        self._network_ids: list[str] = []
+        self._network_id_to_index: dict[str, int] = {}
+        self._templates: list[str] = []
+        self._template_to_index: dict[str, int] = {}
+        self._template_counts: list[int] = []
+
+        # entry columns
+        self._entry_students = array("I")
+        self._entry_severities = array("d")
+        self._entry_templates = array("I")
+        self._entry_args: list[tuple[Any, ...] | None] = []
+
+        # indices of entries
+        self._by_severity: dict[float, array[int]] = {}
+        self._by_student: list[array[int]] = []
+
+    def __len__(self) -> int:
+        return len(self._entry_args)
+
+    # {{{ adding entries
+
+    def add(self, network_id: str, severity: float, template: str,
+            *args: Any) -> None:
+        istudent = self._network_id_to_index.get(network_id)
+        if istudent is None:
+            istudent = len(self._network_ids)
+            self._network_ids.append(network_id)
+            self._network_id_to_index[network_id] = istudent
+            self._by_student.append(array("I"))
+
+        itemplate = self._template_to_index.get(template)
+        if itemplate is None:
+            itemplate = len(self._templates)
+            self._templates.append(template)
+            self._template_to_index[template] = itemplate
+            self._template_counts.append(0)
+
+        ientry = len(self._entry_args)
+        self._entry_students.append(istudent)
+        self._entry_severities.append(severity)
+        self._entry_templates.append(itemplate)
+        self._entry_args.append(args or None)
+
+        by_severity = self._by_severity.get(severity)
+        if by_severity is None:
+            by_severity = self._by_severity[severity] = array("I")
+        by_severity.append(ientry)
+        self._by_student[istudent].append(ientry)
+        self._template_counts[itemplate] += 1
+
+    def make_add_log(self, network_id: str) -> Callable[..., None]:
+        """Return an ``add_log(severity, msg, *args)`` function for the
+        student with *network_id*, as passed to the course rules. If *args*
+        are given, *msg* is a %-format template for them.
+        """
+        add = self.add
+
+        def add_log(severity: float, msg: str, *args: Any) -> None:
+            """severity: 0-5"""
+            add(network_id, severity, msg, *args)
+
+        return add_log
+
+    # }}}
+
+    # {{{ querying
+
+    def _get_entry(self, ientry: int) -> Diagnostic:
+        return Diagnostic(
+            self._network_ids[self._entry_students[ientry]],
+            _to_severity(self._entry_severities[ientry]),
+            self._templates[self._entry_templates[ientry]],
+            self._entry_args[ientry] or ())
+
+    def __iter__(self) -> Iterator[Diagnostic]:
+        return map(self._get_entry, range(len(self)))
+
+    def get_for_student(self, network_id: str) -> list[Diagnostic]:
+        istudent = self._network_id_to_index.get(network_id)
+        if istudent is None:
+            return []
+        return [self._get_entry(i) for i in self._by_student[istudent]]
+
+    def get_at_least(self, min_severity: float) -> Iterator[Diagnostic]:
+        """Return entries with severity *min_severity* or greater, in the
+        order in which they were added.
+        """
+        return map(self._get_entry, heapq.merge(*[
+            entries for severity, entries in self._by_severity.items()
+            if severity >= min_severity]))
+
+    def get_severity_counts(self) -> dict[float, int]:
+        return {
+            _to_severity(severity): len(entries)
+            for severity, entries in sorted(self._by_severity.items())}
+
+    def get_category_counts(self) -> dict[str, int]:
+        return dict(zip(self._templates, self._template_counts, strict=True))
+
+    # }}}
+
+    def write_jsonl(self, outf: TextIO, min_severity: float | None = None) -> None:
+        """Write entries to *outf* as JSON Lines, one object per entry with
+        the keys ``network_id``, ``severity``, ``template``, ``args`` and
+        ``message``.
+        """
+        entries: Iterable[Diagnostic] = (
+            self if min_severity is None else self.get_at_least(min_severity))
+
+        dumps = json.JSONEncoder(default=str, ensure_ascii=False).encode
+        write = outf.write
+        for entry in entries:
+            write(dumps({
+                "network_id": entry.network_id,
+                "severity": entry.severity,
+                "template": entry.template,
+                "args": entry.args,
+                "message": entry.message,
+                }))
+            write("\n")
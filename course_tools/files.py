@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+
+def get_cache_dir(name: str) -> Path:
+    """:returns: the directory for cached data of kind *name*."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_home) / "course-tools" / name
+
+
+def write_atomically(filename: str | os.PathLike[str], contents: str | bytes) -> None:
+    """Write *contents* to *filename* through a temporary file, so that
+    readers never see a partially written file.
+    """
+    tmp_filename = Path(f"{os.fspath(filename)}.tmp{os.getpid()}")
+    if isinstance(contents, str):
+        tmp_filename.write_text(contents, encoding="utf-8")
+    else:
+        tmp_filename.write_bytes(contents)
+    os.replace(tmp_filename, filename)
+
+
+def write_cache_file(filename: str | os.PathLike[str], contents: str | bytes) -> None:
+    """Like :func:`write_atomically`, but also create the containing directory
+    and ignore errors.
+    """
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        write_atomically(filename, contents)
+    except OSError:
+        # caching is best-effort
+        pass
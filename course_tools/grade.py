@@ -2,8 +2,6 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from .grade_tools import format_frac
-
 
 if TYPE_CHECKING:
     from collections.abc import Callable
@@ -11,8 +9,11 @@ if TYPE_CHECKING:
     from .data import Database, Student
 
 
+CLOSE_CALL_TEMPLATE = "Close call: %s (has: %.1f -> %s, cutoff: %s)"
+
+
 def make_letter_grade(database: Database, student: Student,
-                      add_log: Callable[[int | float, str], None]) -> str | None:
+                      add_log: Callable[..., None]) -> str | None:
     if student.grade is None:
         return None
 
@@ -23,7 +24,7 @@ def make_letter_grade(database: Database, student: Student,
 
     scale_name = database.course_rules["GET_SCALE"](student)
 
-    add_log(0, "Scale: %s" % scale_name)
+    add_log(0, "Scale: %s", scale_name)
 
     grade = 100*student.grade
     rounded_grade = round(grade)
@@ -32,9 +33,8 @@ def make_letter_grade(database: Database, student: Student,
 
     for potential_letter, cutoff in zip(letters, cutoffs, strict=False):
         if cutoff > rounded_grade >= cutoff-1:
-            add_log(5, "Close call: %s (has: %s -> %s, cutoff: %s)"
-                    % (potential_letter, format_frac(student.grade),
-                        rounded_grade, cutoff))
+            add_log(5, CLOSE_CALL_TEMPLATE,
+                    potential_letter, grade, rounded_grade, cutoff)
         if rounded_grade >= cutoff:
             letter = potential_letter
             break
@@ -44,3 +44,28 @@ def make_letter_grade(database: Database, student: Student,
         letter = override(student, grade, rounded_grade, letter, add_log)
 
     return letter
+
+
+def grade_students(database: Database) -> None:
+    """Compute grade, rounded grade and letter grade for each student in
+    *database* using the course rules, logging to
+    :attr:`~course_tools.data.Database.diagnostics`.
+    """
+    assert database.course_rules is not None
+
+    make_grade = database.course_rules["MAKE_GRADE"]
+    for netid, student in database.students.items():
+        add_log = database.diagnostics.make_add_log(netid)
+
+        grade = make_grade(student, add_log)
+        student.set_attribute("grade", grade)
+
+        if grade is not None:
+            rounded_grade = round(100*grade)
+            letter_grade = make_letter_grade(database, student, add_log)
+        else:
+            rounded_grade = None
+            letter_grade = None
+
+        student.set_attribute("rounded_grade", rounded_grade)
+        student.set_attribute("letter_grade", letter_grade)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import heapq
+from random import Random
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Sequence
+
+    from course_tools.data import Student
+
+
+def read_keep_apart_csv(filename: str) -> list[tuple[str, str]]:
+    """Read pairs of network IDs that must not be placed in the same group,
+    one comma-separated pair per line. Lines starting with ``#`` are ignored.
+    """
+    import csv
+
+    with open(filename, encoding="utf-8") as csvfile:
+        return [
+            (row[0].strip().lower(), row[1].strip().lower())
+            for row in csv.reader(ln for ln in csvfile if not ln.startswith("#"))
+            if len(row) >= 2]
+
+
+def assign_groups(
+        students: Iterable[Student],
+        capacities: Sequence[int],
+        *,
+        seed: int | None = None,
+        balance_key: Callable[[Student], Any] | None = None,
+        keep_apart: Iterable[tuple[str, str]] = (),
+        ) -> list[list[Student]]:
+    """Randomly assign *students* to groups (e.g. rooms) with the given
+    *capacities*.
+
+    Students are shuffled, ordered by *balance_key* if given, and then dealt
+    one by one to the least-filled group (relative to its capacity) that
+    does not already contain someone they must be kept apart from. This
+    keeps every value of *balance_key* spread evenly across the groups and
+    runs in O(n log g) time for *n* students and *g* groups, as long as
+    *keep_apart* is sparse.
+
+    :arg seed: makes the assignment reproducible.
+    :arg keep_apart: pairs of network IDs that must end up in different
+        groups.
+    """
+    students = list(students)
+    if sum(capacities) < len(students):
+        raise ValueError(
+            "not enough room for %d students (total capacity: %d)"
+            % (len(students), sum(capacities)))
+
+    rng = Random(seed)
+    rng.shuffle(students)
+    if balance_key is not None:
+        # stable, so the shuffled order is kept within each stratum
+        students.sort(key=lambda student: str(balance_key(student)))
+
+    conflicts: dict[str, set[str]] = {}
+    for a, b in keep_apart:
+        conflicts.setdefault(a, set()).add(b)
+        conflicts.setdefault(b, set()).add(a)
+
+    groups: list[list[Student]] = [[] for _cap in capacities]
+    group_of: dict[str, int] = {}
+
+    # (fill fraction, group index)
+    heap = [(0., igroup) for igroup, cap in enumerate(capacities) if cap > 0]
+    heapq.heapify(heap)
+
+    for student in students:
+        netid = student.network_id
+        assert netid is not None
+        partner_groups = {
+            group_of[partner]
+            for partner in conflicts.get(netid, ()) if partner in group_of}
+
+        skipped = []
+        while heap:
+            entry = heapq.heappop(heap)
+            if entry[1] in partner_groups:
+                skipped.append(entry)
+            else:
+                break
+        else:
+            raise ValueError(
+                "cannot place '%s' in any group apart from %s"
+                % (netid, ", ".join(sorted(conflicts.get(netid, ())))))
+
+        igroup = entry[1]
+        groups[igroup].append(student)
+        group_of[netid] = igroup
+
+        fill = len(groups[igroup])
+        if fill < capacities[igroup]:
+            heapq.heappush(heap, (fill / capacities[igroup], igroup))
+
+        for skipped_entry in skipped:
+            heapq.heappush(heap, skipped_entry)
+
+    return groups
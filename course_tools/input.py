@@ -1,18 +1,22 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, Any, Literal, cast
 
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Callable, Iterable, Mapping, Sequence
 
     from course_tools.data import Database
 
 
+from .files import write_cache_file
+
+
 # {{{ moodle
 
-def read_moodle_csv(database: Database, csv_name: str) -> None:
+def parse_moodle_csv(csv_name: str) -> list[dict[str, Any]]:
     import csv
 
     with open(csv_name, encoding="utf-8") as csvfile:
@@ -43,10 +47,15 @@ def read_moodle_csv(database: Database, csv_name: str) -> None:
         except ValueError:
             return v
 
-    for row in data[1:]:
-        row_dict = {
-            proc_colname(colname): proc_value(value)
+    col_names = [proc_colname(colname) for colname in col_names]
+    return [
+        {colname: proc_value(value)
             for colname, value in zip(col_names, row, strict=False)}
+        for row in data[1:]]
+
+
+def merge_moodle_rows(database: Database, rows: Iterable[dict[str, Any]]) -> None:
+    for row_dict in rows:
         netid = row_dict["Username"]
         student = database.get_student(netid)
         student.set_attribute("network_id", netid)
@@ -54,12 +63,16 @@ def read_moodle_csv(database: Database, csv_name: str) -> None:
         student.set_attribute("first_name", row_dict["First name"])
         student.set_attribute("csv_row", row_dict)
 
+
+def read_moodle_csv(database: Database, csv_name: str) -> None:
+    merge_moodle_rows(database, parse_moodle_csv(csv_name))
+
 # }}}
 
 
 # {{{ relate
 
-def read_relate_csv(database: Database, csv_name: str) -> None:
+def parse_relate_csv(csv_name: str) -> list[dict[str, Any]]:
     import csv
 
     with open(csv_name, encoding="utf-8") as csvfile:
@@ -81,9 +94,14 @@ def read_relate_csv(database: Database, csv_name: str) -> None:
         except ValueError:
             return v
 
-    for row in data[1:]:
-        row_dict = {colname: proc_value(value)
+    return [
+        {colname: proc_value(value)
             for colname, value in zip(col_names, row, strict=False)}
+        for row in data[1:]]
+
+
+def merge_relate_rows(database: Database, rows: Iterable[dict[str, Any]]) -> None:
+    for row_dict in rows:
         email = row_dict["user_name"]
         netid = email[:email.find("@")].lower()
         student = database.get_student(netid)
@@ -92,17 +110,26 @@ def read_relate_csv(database: Database, csv_name: str) -> None:
         student.set_attribute("first_name", row_dict["first_name"])
         student.set_attribute("csv_row", row_dict)
 
+
+def read_relate_csv(database: Database, csv_name: str) -> None:
+    merge_relate_rows(database, parse_relate_csv(csv_name))
+
 # }}}
 
 
 # {{{ my.engr html
 
-def read_my_engr_html_roster(database: Database, html_name: str) -> None:
+def parse_my_engr_html_roster(html_name: str) -> list[tuple[str, dict[str, str]]]:
+    """
+    :returns: a list of tuples of the section heading under which each
+        row was found and the row.
+    """
     from bs4 import BeautifulSoup
     soup = BeautifulSoup(
                 Path(html_name).read_text(encoding="utf-8", errors="replace"),
                 "lxml")
 
+    result = []
     for child in soup.find(
             "div", attrs={"class": "module_content"}).find_all("div"):
         if "id" in child.attrs and child["id"].startswith("rostertable"):
@@ -113,36 +140,182 @@ def read_my_engr_html_roster(database: Database, html_name: str) -> None:
                 # empty section
                 continue
 
-            rosterhead = rostertable_div.find("table").find("thead")
-            rosterbody = rostertable_div.find("table").find("tbody")
+            rosterhead = rostertable.find("thead")
+            rosterbody = rostertable.find("tbody")
+            assert rosterhead is not None
+            assert rosterbody is not None
 
-            columns = [span.string for span in rosterhead.find_all("span")]
+            columns = [str(span.string) for span in rosterhead.find_all("span")]
             for tr in rosterbody.find_all("tr"):
                 row = dict(zip(columns, [
                     td.get_text().strip() for td in tr.find_all("td")], strict=False))
+                result.append((section_head, row))
+
+    return result
+
+
+def merge_my_engr_roster_rows(
+        database: Database, rows: Iterable[tuple[str, dict[str, str]]]) -> None:
+    for section_head, row in rows:
+        netid = row["Net ID"]
+        student = database.get_student(netid)
+        last_name, first_name = row["Name"].split(",", 1)
+        last_name = last_name.strip()
+        first_name = first_name.strip()
+
+        section_tbl = row["Class"].split()[-1]
+
+        if section_head != section_tbl:
+            from warnings import warn
+            warn(
+                f"student {netid} in section {section_tbl} found under "
+                f"section heading {section_head}, ignoring heading",
+                # point at the caller of whoever called merge_input
+                stacklevel=4)
+
+        student.set_attribute("standing", row["Year"])
+        student.set_attribute("section", section_tbl)
+        student.set_attribute("credit_hours", int(row["Credit"]))
+        student.set_attribute("university_id", row["UIN"])
+        student.set_attribute("roster_row", row)
+        student.set_attribute("last_name", last_name)
+        student.set_attribute("first_name", first_name)
+
+
+def read_my_engr_html_roster(database: Database, html_name: str) -> None:
+    merge_input(database, "my_cs_html_roster", parse_my_engr_html_roster(html_name))
+
+# }}}
+
+
+# {{{ concurrent reading
+
+InputKind = Literal["moodle_csv", "relate_csv", "my_cs_html_roster"]
+
+_PARSERS: Mapping[InputKind, Callable[[str], list[Any]]] = {
+    "moodle_csv": parse_moodle_csv,
+    "relate_csv": parse_relate_csv,
+    "my_cs_html_roster": parse_my_engr_html_roster,
+    }
+
+_MERGERS: Mapping[InputKind, Callable[[Database, list[Any]], None]] = {
+    "moodle_csv": merge_moodle_rows,
+    "relate_csv": merge_relate_rows,
+    "my_cs_html_roster": merge_my_engr_roster_rows,
+    }
+
 
-                netid = row["Net ID"]
-                student = database.get_student(netid)
-                last_name, first_name = row["Name"].split(",", 1)
-                last_name = last_name.strip()
-                first_name = first_name.strip()
-
-                section_tbl = row["Class"].split()[-1]
-
-                if section_head != section_tbl:
-                    from warnings import warn
-                    warn(
-                        f"student {netid} in section {section_tbl} found under "
-                        f"section heading {section_head}, ignoring heading",
-                        stacklevel=2)
-
-                student.set_attribute("standing", row["Year"])
-                student.set_attribute("section", section_tbl)
-                student.set_attribute("credit_hours", int(row["Credit"]))
-                student.set_attribute("university_id", row["UIN"])
-                student.set_attribute("roster_row", row)
-                student.set_attribute("last_name", last_name)
-                student.set_attribute("first_name", first_name)
+def parse_input(kind: InputKind, filename: str) -> list[Any]:
+    """Parse *filename* into a list of rows that can be passed to
+    :func:`merge_input`. The result is picklable.
+    """
+    return _PARSERS[kind](filename)
+
+
+def merge_input(database: Database, kind: InputKind, rows: list[Any]) -> None:
+    _MERGERS[kind](database, rows)
+
+
+# bump when the format of parsed rows changes, to invalidate cached ones
+_PARSED_INPUT_CACHE_VERSION = 1
+
+
+def _get_parsed_input_cache_file(
+        cache_dir: str, kind: InputKind, filename: str) -> str:
+    import hashlib
+    key = hashlib.sha256(
+        f"{_PARSED_INPUT_CACHE_VERSION}\0{kind}\0".encode()
+        + Path(filename).read_bytes())
+    return os.path.join(cache_dir, f"{key.hexdigest()}.pickle")
+
+
+# BeautifulSoup holds the GIL while parsing, so HTML rosters are only
+# parsed in parallel in separate processes. The CSV parsers are cheap
+# enough that threads, which start much faster, do for them.
+_PARSED_IN_PROCESSES: frozenset[InputKind] = frozenset({"my_cs_html_roster"})
+
+
+def parse_inputs(
+        inputs: Sequence[tuple[InputKind, str]],
+        nworkers: int | None = None,
+        cache_dir: str | None = None) -> list[list[Any]]:
+    """Parse each ``(kind, filename)`` in *inputs* concurrently, using up to
+    *nworkers* processes for HTML rosters and up to *nworkers* threads for
+    all other inputs.
+
+    :arg cache_dir: if given, parsed rows are cached in this directory,
+        keyed by the contents of each input file, and reused by later calls.
+    :returns: a list of row batches, in the order of *inputs*.
+    """
+    import pickle
+
+    results: list[list[Any] | None] = [None] * len(inputs)
+    cache_files: list[str | None] = [None] * len(inputs)
+    if cache_dir is not None:
+        for i, (kind, filename) in enumerate(inputs):
+            cache_files[i] = cache_file = _get_parsed_input_cache_file(
+                cache_dir, kind, filename)
+            try:
+                with open(cache_file, "rb") as inf:
+                    results[i] = pickle.load(inf)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+    to_parse = [i for i, rows in enumerate(results) if rows is None]
+    kinds: list[InputKind] = [inputs[i][0] for i in to_parse]
+    filenames = [inputs[i][1] for i in to_parse]
+
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+    nworkers = min(nworkers, len(to_parse))
+
+    if nworkers <= 1:
+        parsed = list(map(parse_input, kinds, filenames))
+    else:
+        from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+        from contextlib import ExitStack
+
+        nin_processes = sum(kind in _PARSED_IN_PROCESSES for kind in kinds)
+        with ExitStack() as stack:
+            threads = stack.enter_context(ThreadPoolExecutor(nworkers))
+            # a single roster gains nothing from a process of its own
+            processes: Executor = (
+                stack.enter_context(
+                    ProcessPoolExecutor(min(nworkers, nin_processes)))
+                if nin_processes > 1 else threads)
+
+            futures = [
+                (processes if kind in _PARSED_IN_PROCESSES else threads).submit(
+                    parse_input, kind, filename)
+                for kind, filename in zip(kinds, filenames, strict=True)]
+            parsed = [future.result() for future in futures]
+
+    for i, rows in zip(to_parse, parsed, strict=True):
+        results[i] = rows
+
+        cache_file = cache_files[i]
+        if cache_file is not None:
+            write_cache_file(
+                cache_file, pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return cast("list[list[Any]]", results)
+
+
+def read_inputs(
+        database: Database,
+        inputs: Sequence[tuple[InputKind, str]],
+        nworkers: int | None = None,
+        cache_dir: str | None = None) -> None:
+    """Read all of *inputs* into *database*. Parsing happens concurrently
+    (see :func:`parse_inputs`), while merging into *database* happens in
+    the order of *inputs*, so that the result is the same as that of
+    reading the files one after the other.
+    """
+    for (kind, _filename), rows in zip(
+            inputs,
+            parse_inputs(inputs, nworkers, cache_dir),
+            strict=True):
+        merge_input(database, kind, rows)
 
 # }}}
 
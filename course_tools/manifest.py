@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, TypeVar
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping, Sequence
+
+    from course_tools.input import InputKind
+
+
+T = TypeVar("T")
+
+INPUT_KINDS: Sequence[InputKind] = ("moodle_csv", "relate_csv", "my_cs_html_roster")
+
+
+def _resolve(base_dir: str, path: str) -> str:
+    return os.path.normpath(os.path.join(base_dir, path))
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    """One entry of a manifest read by :func:`read_manifest`."""
+
+    name: str
+    base_dir: str
+    course_rules: str
+    inputs: Sequence[tuple[InputKind, str]]
+    # keyword arguments to course_tools.query.apply_limits
+    limits: Mapping[str, Any]
+    # keys not handled by read_manifest, to be popped by the caller
+    options: dict[str, Any]
+
+    def resolve(self, path: str) -> str:
+        """Resolve *path* relative to the directory containing the manifest."""
+        return _resolve(self.base_dir, path)
+
+
+def read_manifest(
+        filename: str, entry_kind: str,
+        parse_entry: Callable[[ManifestEntry], T]) -> list[T]:
+    """Read a JSON manifest with a list of entries of *entry_kind* (e.g.
+    ``"course"``) under the key ``<entry_kind>s``. Each entry has the form::
+
+        {
+            "name": "cs450",
+            "course_rules": "rules-cs450.py",
+            "moodle_csv": ["gradebook.csv"],
+            "relate_csv": [],
+            "my_cs_html_roster": ["roster-al1.html", "roster-al2.html"],
+            "limit_to_section": ["AL1"],
+            "limit_to_standing": null,
+            "limit_to_scale": null,
+            "remove_students_without_section": false,
+            ...
+        }
+
+    Relative paths are relative to the directory containing the manifest.
+    Only ``name`` and ``course_rules`` are required. Any further keys are
+    left in :attr:`ManifestEntry.options` for *parse_entry*, which must pop
+    all of those it understands.
+
+    :returns: the results of *parse_entry* for each entry, in order.
+    """
+    with open(filename, encoding="utf-8") as inf:
+        manifest = json.load(inf)
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+
+    result = []
+    names = []
+    for raw_entry in manifest[f"{entry_kind}s"]:
+        options = dict(raw_entry)
+        name = options.pop("name")
+        entry = ManifestEntry(
+            name=name,
+            base_dir=base_dir,
+            course_rules=_resolve(base_dir, options.pop("course_rules")),
+            inputs=[
+                (kind, _resolve(base_dir, input_name))
+                for kind in INPUT_KINDS
+                for input_name in options.pop(kind, [])],
+            limits={
+                "has_section": options.pop(
+                    "remove_students_without_section", False),
+                "sections": options.pop("limit_to_section", []),
+                "standing": options.pop("limit_to_standing", None),
+                "scale": options.pop("limit_to_scale", None),
+                },
+            options=options)
+
+        result.append(parse_entry(entry))
+
+        if options:
+            raise ValueError(
+                "%s '%s': unknown manifest keys: %s"
+                % (entry_kind, name, ", ".join(sorted(options))))
+        names.append(name)
+
+    if len(set(names)) != len(names):
+        raise ValueError("%s names in manifest are not unique" % entry_kind)
+
+    return result
@@ -2,34 +2,41 @@ from __future__ import annotations
 
 import os
 import sys
-from random import Random
-from typing import TYPE_CHECKING, TypeVar, cast
-
-import numpy as np
+from contextlib import ExitStack
+from functools import cache
+from typing import TYPE_CHECKING, Any, TextIO, TypeVar, cast
 
 
 if TYPE_CHECKING:
-    from collections.abc import Mapping
-
-    from openpyxl import Worksheet
+    from collections.abc import Callable, Mapping, Sequence
 
     from course_tools.data import Database, Student
+    from course_tools.report import ReportFormat
 
 
-from .grade_tools import format_frac
+from . import report
+from .report import get_student_report_data, render_student_report_text
 
 
 T = TypeVar("T")
 
 
-try:
-    from vt100 import c
-except ImportError:
-    def c(name):
-        return ""
+@cache
+def _get_color_func() -> Callable[[str], str]:
+    try:
+        from vt100 import c
+    except ImportError:
+        def c(name):
+            return ""
+
+        from warnings import warn
+        warn("vt100 module not found--colored output disabled", stacklevel=3)
 
-    from warnings import warn
-    warn("vt100 module not found--colored output disabled", stacklevel=2)
+    return c
+
+
+def c(name: str) -> str:
+    return _get_color_func()(name)
 
 
 def _assert_not_none(val: T | None) -> T:
@@ -48,10 +55,26 @@ def print_scales(database: Database):
 
 
 def print_warnings(database: Database, warn_level: int):
-    for student in database.students.values():
-        for severity, ln in student.log:
-            if severity >= warn_level:
-                print("*** %s: %s" % (student.network_id, ln), file=sys.stderr)
+    for entry in database.diagnostics.get_at_least(warn_level):
+        print("*** %s: %s" % (entry.network_id, entry.message), file=sys.stderr)
+
+
+def print_diagnostic_counts(database: Database):
+    diagnostics = database.diagnostics
+
+    print("-"*75)
+    print("SEVERITY COUNTS")
+    print("-"*75)
+    for severity, count in diagnostics.get_severity_counts().items():
+        print("%-3s : % 8d" % (severity, count))
+
+    print("-"*75)
+    print("CATEGORY COUNTS")
+    print("-"*75)
+    for template, count in sorted(
+            diagnostics.get_category_counts().items(),
+            key=lambda item: -item[1]):
+        print("% 8d : %s" % (count, template))
 
 
 def find_student(database: Database, search_term: str):
@@ -81,27 +104,23 @@ def find_student(database: Database, search_term: str):
 def print_student_report(database: Database, search_term: str):
     student = find_student(database, search_term)
 
-    print("-"*75)
     print(
-        "%s, %s (%s)"
-        % (student.last_name, student.first_name, student.network_id))
-    print("-"*75)
-    print("UIN: %s" % student.university_id)
-    print("Section: %s" % student.section)
-    print(f"Credit hours: {student.credit_hours}")
-    print("Standing: %s" % student.standing)
-    print("Scale: %s" % database.course_rules["GET_SCALE"](student))
-    for severity, ln in student.log:
-        if severity >= 4:
-            ln = c("bright red") + "/!\\ " + ln + c("normal")
-
-        print(ln)
-
-    print("-"*75)
-    print("Grade: %s" % format_frac(student.grade))
-    print("Rounded grade: %s" % student.rounded_grade)
-    print("Letter grade: %s" % student.letter_grade)
-    print("-"*75)
+        render_student_report_text(
+            get_student_report_data(database, student),
+            highlight=lambda ln: c("bright red") + ln + c("normal")),
+        end="")
+
+
+def write_student_reports(
+        database: Database, output_dir: str,
+        fmt: ReportFormat = "txt", nprocs: int | None = None,
+        prune: bool = False) -> None:
+    nwritten, nunchanged, nremoved = report.write_student_reports(
+        database, output_dir, fmt, nprocs, prune)
+    print(
+        f"*** {nwritten} student report(s) written, {nunchanged} unchanged, "
+        f"{nremoved} removed",
+        file=sys.stderr)
 
 
 def print_grade_list(database: Database):
@@ -168,6 +187,7 @@ def plot_histogram(database: Database, differentiated: bool):
         dataset_names = ["Everybody"]
 
     import matplotlib.pyplot as pt
+    import numpy as np
     for name, ds in zip(dataset_names, datasets, strict=False):
         print("%s: mean: %.2f - stddev: %.2f (n=%d)" % (
             name, np.average(ds), np.std(ds), len(ds)))
@@ -189,144 +209,394 @@ def print_letter_histogram(database):
         print("%-3s : % 4d : %s" % (ltr, count, count*"#"))
 
 
-def print_emails(database: Database, email_suffix="") -> None:
-    students = sorted(
+# {{{ per-student line writers
+
+# Each of these takes a text stream and returns a function that writes the
+# output for one student to it. Students are expected to be passed in order
+# of network ID.
+
+def _sorted_by_network_id(database: Database) -> list[Student]:
+    return sorted(
         database.students.values(),
-        key=lambda student: cast("str", student.network_id))
+        key=lambda student: _assert_not_none(student.network_id))
 
-    for student in students:
-        print(f"{student.network_id}{email_suffix}")
 
+def _make_emails_writer(
+        outf: TextIO, email_suffix: str = "") -> Callable[[Student], None]:
+    write = outf.write
+
+    def write_student(student: Student) -> None:
+        write(f"{student.network_id}{email_suffix}\n")
+
+    return write_student
 
-def print_roster_csv(database: Database) -> None:
-    students = sorted(
-        database.students.values(),
-        key=lambda student: cast("str", student.network_id))
 
+def _make_roster_csv_writer(outf: TextIO) -> Callable[[Student], None]:
     import csv
-    writer = csv.writer(sys.stdout)
+    writer = csv.writer(outf)
     writer.writerow(["NetID", "First Name", "Last Name", "UIN", "Section"])
-    for student in students:
+
+    def write_student(student: Student) -> None:
         writer.writerow([student.network_id, student.first_name, student.last_name,
                         student.university_id, student.section])
 
+    return write_student
 
-def print_banner_csv(database: Database) -> None:
-    students = sorted(
-        database.students.values(),
-        key=lambda student: _assert_not_none(student.network_id))
 
-    for student in students:
+def _make_banner_csv_writer(outf: TextIO) -> Callable[[Student], None]:
+    write = outf.write
+
+    def write_student(student: Student) -> None:
         if not student.university_id:
             print(
                 "*** %s (Section %s) does not have a university_id"
                 % (student.network_id, getattr(student, "section", None)),
                 file=sys.stderr)
         else:
-            print("%s,%-3s    # %s" % (
+            write("%s,%-3s    # %s\n" % (
                 student.university_id, student.letter_grade,
                 student.network_id))
 
+    return write_student
+
+
+def _make_relate_csv_writer(outf: TextIO) -> Callable[[Student], None]:
+    write = outf.write
+
+    def write_student(student: Student) -> None:
+        if student.rounded_grade is not None:
+            write("%s,%.2f,Letter grade: %s\n" % (
+                student.network_id,
+                student.rounded_grade,
+                student.letter_grade))
+
+    return write_student
+
+
+def _make_preliminary_relate_csv_writer(outf: TextIO) -> Callable[[Student], None]:
+    import csv
+    writer = csv.writer(outf, quoting=csv.QUOTE_MINIMAL)
+
+    def write_student(student: Student) -> None:
+        writer.writerow([
+            student.network_id,
+            "%.2f" % (100*_assert_not_none(student.grade)),
+            ""])
+
+    return write_student
 
-def _get_ws_column_headers(ws: Worksheet) -> Mapping[str, int]:
+
+def _write_sorted(
+        database: Database, write_student: Callable[[Student], None]) -> None:
+    for student in _sorted_by_network_id(database):
+        write_student(student)
+
+# }}}
+
+
+def print_emails(database: Database, email_suffix="") -> None:
+    _write_sorted(database, _make_emails_writer(sys.stdout, email_suffix))
+
+
+def print_roster_csv(database: Database) -> None:
+    _write_sorted(database, _make_roster_csv_writer(sys.stdout))
+
+
+def print_banner_csv(database: Database) -> None:
+    _write_sorted(database, _make_banner_csv_writer(sys.stdout))
+
+
+# {{{ banner xlsx
+
+def _get_column_headers(header_row: Sequence[Any]) -> Mapping[str, int]:
+    """Map the headers in *header_row* up to the first empty one to their
+    zero-based column index.
+    """
     result = {}
-    i = 1
-    while h := ws.cell(row=1, column=i).value:
+    for i, h in enumerate(header_row):
+        if not h:
+            break
         result[h] = i
-        i += 1
 
     return result
 
 
-def update_banner_xlsx(database: Database, filename: str) -> None:
+def _fill_banner_template(
+        filename: str, grades: Mapping[str, str | None], found: set[str]) -> None:
     from openpyxl import load_workbook
     wb = load_workbook(filename)
     ws = wb.active
+    assert ws is not None
 
-    headers = _get_ws_column_headers(ws)
+    rows = ws.iter_rows(values_only=True)
+    headers = _get_column_headers(next(rows, ()))
     student_id_col = headers["Student ID"]
     grade_col = headers["Final Grade"]
 
-    sid_to_row = {}
-    i = 2
-    while sid := ws.cell(row=i, column=student_id_col).value:
-        sid_to_row[sid] = i
-        i += 1
+    for i, row in enumerate(rows, start=2):
+        sid = row[student_id_col]
+        if not sid:
+            break
+        sid = str(sid)
+        if sid in grades:
+            ws.cell(row=i, column=grade_col + 1, value=grades[sid])
+            found.add(sid)
+
+    nm, ext = os.path.splitext(filename)
+    wb.save(f"{nm}-updated{ext}")
+
+
+def _fill_banner_template_streaming(
+        filename: str, grades: Mapping[str, str | None], found: set[str]) -> None:
+    from openpyxl import Workbook, load_workbook
+    src_wb = load_workbook(filename, read_only=True)
+    grades_ws = src_wb.active
+    assert grades_ws is not None
+
+    dst_wb = Workbook(write_only=True)
+    for src_ws in src_wb.worksheets:
+        dst_ws = dst_wb.create_sheet(src_ws.title)
+        rows = src_ws.iter_rows(values_only=True)
+
+        if src_ws.title != grades_ws.title:
+            for row in rows:
+                dst_ws.append(row)
+            continue
+
+        header_row = next(rows, ())
+        headers = _get_column_headers(header_row)
+        student_id_col = headers["Student ID"]
+        grade_col = headers["Final Grade"]
+        dst_ws.append(header_row)
+
+        in_student_rows = True
+        for row in rows:
+            sid = row[student_id_col] if student_id_col < len(row) else None
+            if not sid:
+                in_student_rows = False
+
+            if in_student_rows and (sid := str(sid)) in grades:
+                new_row = list(row)
+                if grade_col >= len(new_row):
+                    new_row.extend([None] * (grade_col + 1 - len(new_row)))
+                new_row[grade_col] = grades[sid]
+                found.add(sid)
+                dst_ws.append(new_row)
+            else:
+                dst_ws.append(row)
+
+    src_wb.close()
 
+    nm, ext = os.path.splitext(filename)
+    dst_wb.save(f"{nm}-updated{ext}")
+
+
+def update_banner_xlsx(
+        database: Database,
+        filenames: str | Sequence[str],
+        streaming: bool = False) -> None:
+    """Fill in letter grades in one or more Banner XLSX templates (e.g. one
+    per section), writing each to ``<name>-updated.xlsx``. With *streaming*,
+    templates are read and written row by row, which uses much less memory on
+    large templates but does not preserve cell formatting. All sheets are
+    copied; grades are filled into the active one.
+
+    Students without a university ID or not found in any of the templates
+    are reported in a summary on stderr.
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
+
+    grades: dict[str, str | None] = {}
+    no_uin: list[Student] = []
     for student in database.students.values():
         if not student.university_id:
-            print(
-                f"*** {student.network_id} "
-                f"(Section {getattr(student, 'section', None)}) "
-                "does not have a university_id",
-                file=sys.stderr)
-        elif student.university_id not in sid_to_row:
-            print(
-                f"*** {student.network_id} "
-                f"(Section {getattr(student, 'section', None)}) "
-                "is not in template XLS",
-                file=sys.stderr)
+            no_uin.append(student)
         else:
-            ws.cell(
-                    row=sid_to_row[student.university_id],
-                    column=grade_col,
-                    value=student.letter_grade)
+            grades[student.university_id] = student.letter_grade
 
-    nm, ext = os.path.splitext(filename)
-    wb.save(f"{nm}-updated{ext}")
+    found: set[str] = set()
+    fill = _fill_banner_template_streaming if streaming else _fill_banner_template
+    for filename in filenames:
+        fill(filename, grades, found)
 
+    not_in_template = [
+        student for student in database.students.values()
+        if student.university_id and student.university_id not in found]
 
-def print_relate_csv(database: Database) -> None:
-    students = sorted(
-        database.students.values(),
-        key=lambda student: _assert_not_none(student.network_id))
+    def format_students(students: list[Student]) -> str:
+        return ", ".join(
+            f"{student.network_id} (Section {getattr(student, 'section', None)})"
+            for student in sorted(
+                students, key=lambda student: _assert_not_none(student.network_id)))
 
-    for student in students:
-        if student.rounded_grade is not None:
-            print("%s,%.2f,Letter grade: %s" % (
-                student.network_id,
-                student.rounded_grade,
-                student.letter_grade))
+    print(
+        f"*** Banner XLSX: {len(found)} grades filled in "
+        f"{len(filenames)} template(s)",
+        file=sys.stderr)
+    if no_uin:
+        print(
+            f"*** {len(no_uin)} student(s) do not have a university_id: "
+            + format_students(no_uin),
+            file=sys.stderr)
+    if not_in_template:
+        print(
+            f"*** {len(not_in_template)} student(s) are not in template XLS: "
+            + format_students(not_in_template),
+            file=sys.stderr)
+
+# }}}
 
 
-def print_preliminary_relate_csv(database: Database):
-    students = sorted(
-        database.students.values(),
-        key=lambda student: student.network_id)
+def print_relate_csv(database: Database) -> None:
+    _write_sorted(database, _make_relate_csv_writer(sys.stdout))
 
-    import csv
-    writer = csv.writer(sys.stdout, quoting=csv.QUOTE_MINIMAL)
-    for student in students:
-        writer.writerow([
-            student.network_id,
-            "%.2f" % (100*student.grade),
-            ""])
 
+def print_preliminary_relate_csv(database: Database):
+    _write_sorted(database, _make_preliminary_relate_csv_writer(sys.stdout))
 
-def print_relate_not_in_roster_query(database: Database, email_suffix: str) -> None:
-    students = sorted(
-        database.students.values(),
-        key=lambda student: cast("str", student.network_id))
 
-    pos_query = " or ".join(
-            f"email:{student.network_id}{email_suffix}"
-            for student in students)
+# {{{ multi-format output
 
-    print(f"role:student and status:active and not ({pos_query})")
+# output name -> (file name, writer factory)
+OUTPUT_FORMATS: Mapping[str, tuple[str, Callable[..., Callable[[Student], None]]]] = {
+    "emails": ("emails.txt", _make_emails_writer),
+    "roster-csv": ("roster.csv", _make_roster_csv_writer),
+    "banner-csv": ("banner.csv", _make_banner_csv_writer),
+    "relate-csv": ("relate.csv", _make_relate_csv_writer),
+    "preliminary-relate-csv": (
+        "preliminary-relate.csv", _make_preliminary_relate_csv_writer),
+    }
 
 
-def print_random_group_csv(database: Database, group_size: int) -> None:
-    ngroups = (len(database.students) + group_size - 1) // group_size
-    groups: list[list[Student]] = [[] for _i in range(ngroups)]
+def _open_output(filename: str, compress: bool) -> TextIO:
+    if compress:
+        import gzip
+        return cast("TextIO", gzip.open(
+            filename + ".gz", "wt", encoding="utf-8", newline="",
+            compresslevel=6))
+    else:
+        return open(filename, "w", encoding="utf-8", newline="",
+                    buffering=1 << 20)
+
+
+def write_outputs(
+        database: Database,
+        output_names: Sequence[str],
+        output_dir: str,
+        *,
+        email_suffix: str = "",
+        compress: bool = False) -> None:
+    """Write each of the outputs in *output_names* (keys of
+    :data:`OUTPUT_FORMATS`) to its own file in *output_dir*. Students are
+    sorted once and visited once for all outputs together.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ExitStack() as stack:
+        writers = []
+        for name in output_names:
+            filename, make_writer = OUTPUT_FORMATS[name]
+            outf = stack.enter_context(
+                _open_output(os.path.join(output_dir, filename), compress))
+            if name == "emails":
+                writers.append(make_writer(outf, email_suffix))
+            else:
+                writers.append(make_writer(outf))
+
+        for student in _sorted_by_network_id(database):
+            for write_student in writers:
+                write_student(student)
+
+# }}}
+
+
+def print_relate_not_in_roster_query(
+        database: Database, email_suffix: str,
+        chunk_size: int | None = None) -> None:
+    """Print a Relate participant query for active students not on the
+    roster. If *chunk_size* is given, print one query per *chunk_size*
+    rostered students instead. Students not on the roster are then those
+    matched by every one of the queries.
+    """
+    students = _sorted_by_network_id(database)
+
+    if chunk_size is None:
+        chunk_size = max(1, len(students))
+
+    nchunks = 0
+    for start in range(0, len(students), chunk_size):
+        pos_query = " or ".join(
+                f"email:{student.network_id}{email_suffix}"
+                for student in students[start:start+chunk_size])
+
+        print(f"role:student and status:active and not ({pos_query})")
+        nchunks += 1
+
+    if nchunks > 1:
+        print(
+            f"*** {nchunks} queries printed: students not on the roster "
+            "are those matched by all of them",
+            file=sys.stderr)
+
+
+def print_relate_roster_difference(
+        database: Database, relate_database: Database, email_suffix: str) -> None:
+    from .query import relate_roster_difference
+    relate_only, roster_only = relate_roster_difference(database, relate_database)
+
+    print("-"*75)
+    print("IN RELATE, NOT ON ROSTER (%d)" % len(relate_only))
+    print("-"*75)
+    for netid in relate_only:
+        student = relate_database.students[netid]
+        print(student.csv_row.get("user_name") or f"{netid}{email_suffix}")
 
-    rng = Random()
-    students = list(database.students.values())
-    igroup = 0
-    while students:
-        istudent = rng.randint(0, len(students)-1)
-        groups[igroup].append(students.pop(istudent))
-        igroup = (igroup + 1) % ngroups
+    print("-"*75)
+    print("ON ROSTER, NOT IN RELATE (%d)" % len(roster_only))
+    print("-"*75)
+    for netid in roster_only:
+        print(f"{netid}{email_suffix}")
+
+
+def print_random_group_csv(
+        database: Database,
+        group_size: int,
+        email_suffix: str = "@illinois.edu",
+        *,
+        seed: int | None = None,
+        balance: str | None = None,
+        room_capacities: Sequence[int] | None = None,
+        keep_apart: Sequence[tuple[str, str]] = (),
+        ) -> None:
+    """
+    :arg balance: one of ``"section"``, ``"standing"`` or ``"scale"``, to
+        spread students evenly across groups by that attribute.
+    :arg room_capacities: if given, one group per room with the given
+        capacities, instead of groups of *group_size*.
+    """
+    from .groups import assign_groups
+
+    if room_capacities is None:
+        ngroups = (len(database.students) + group_size - 1) // group_size
+        room_capacities = [group_size] * ngroups
+
+    balance_key: Callable[[Student], Any] | None = None
+    if balance == "scale":
+        assert database.course_rules is not None
+        balance_key = database.course_rules["GET_SCALE"]
+    elif balance is not None:
+        attr_name = balance
+
+        def get_attr(student: Student) -> Any:
+            return getattr(student, attr_name)
+
+        balance_key = get_attr
+
+    groups = assign_groups(
+        database.students.values(), room_capacities,
+        seed=seed, balance_key=balance_key, keep_apart=keep_apart)
 
     for igrp, grp_students in enumerate(groups):
         for s in grp_students:
-            print(f"Room {igrp + 1},{s.network_id}@illinois.edu")
+            print(f"Room {igrp + 1},{s.network_id}{email_suffix}")
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from typing import cast
+from typing import TYPE_CHECKING, Any, cast
 
 from course_tools.data import Database
 
 
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+
 def limit_to_section(database: Database, sections: list[str]) -> Database:
     return Database(database.course_rules, {
         cast("str", student.network_id): student
@@ -38,3 +42,72 @@ def limit_to_standing(database: Database, standing: str) -> Database:
         if student.standing is not None
         and student.standing.startswith(standing)
         })
+
+
+def apply_limits(
+        database: Database,
+        *,
+        has_section: bool = False,
+        sections: Sequence[str] = (),
+        standing: str | None = None,
+        scale: str | None = None) -> Database:
+    """Apply the ``limit_to_*`` filters for the given criteria, in the same
+    order as the command line does.
+    """
+    if has_section:
+        database = limit_to_has_section(database)
+
+    if sections:
+        database = limit_to_section(database, list(sections))
+
+    if standing:
+        database = limit_to_standing(database, standing)
+
+    if scale:
+        database = limit_to_scale(database, scale)
+
+    return database
+
+
+def _is_active_relate_student(row: Mapping[str, Any]) -> bool:
+    columns = {str(name).lower(): value for name, value in row.items()}
+
+    roles = columns.get("roles", columns.get("role"))
+    if roles is not None and "student" not in {
+            role.strip().lower() for role in str(roles).split(",")}:
+        return False
+
+    status = columns.get("status")
+    return status is None or str(status).strip().lower() == "active"
+
+
+def relate_roster_difference(
+        database: Database, relate_database: Database
+        ) -> tuple[list[str], list[str]]:
+    """Compare the students in *database* (the roster) with the participants
+    in *relate_database*, e.g. as read by
+    :func:`course_tools.input.read_relate_csv`.
+
+    Like the query printed by
+    :func:`course_tools.output.print_relate_not_in_roster_query`, only active
+    students count as participants. This is decided by the ``role`` (or
+    ``roles``) and ``status`` columns of the export; if it has no such
+    columns, every row is taken to be an active student.
+
+    :returns: a tuple of sorted network IDs that are in Relate but not on
+        the roster, and on the roster but not in Relate.
+    """
+    roster_ids = database.students.keys()
+    relate_ids = {
+        netid for netid, student in relate_database.students.items()
+        if _is_active_relate_student(student.csv_row)}
+
+    relate_only = []
+    roster_only = []
+    for netid in roster_ids ^ relate_ids:
+        if netid in relate_ids:
+            relate_only.append(netid)
+        else:
+            roster_only.append(netid)
+
+    return sorted(relate_only), sorted(roster_only)
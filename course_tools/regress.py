@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping, Sequence
+
+    from course_tools.input import InputKind
+
+
+from .grade_tools import format_frac
+
+
+HOOK_NAMES = ("MAKE_GRADE", "GET_SCALE", "OVERRIDE_LETTER_GRADE")
+
+
+# {{{ evaluation
+
+@dataclass(frozen=True)
+class StudentResult:
+    grade: float | None
+    rounded_grade: int | None
+    letter_grade: str | None
+    scale: str | None
+
+
+@dataclass
+class HookTiming:
+    ncalls: int = 0
+    seconds: float = 0
+
+
+@dataclass
+class RulesResult:
+    students: dict[str, StudentResult]
+    timings: dict[str, HookTiming] = field(default_factory=dict)
+    total_seconds: float = 0
+
+
+def _make_timed(func: Callable[..., Any], timing: HookTiming) -> Callable[..., Any]:
+    perf_counter = time.perf_counter
+
+    def timed(*args: Any, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timing.seconds += perf_counter() - start
+            timing.ncalls += 1
+
+    return timed
+
+
+def evaluate_rules(
+        rules_filename: str,
+        inputs: Sequence[tuple[InputKind, list[Any]]],
+        limits: Mapping[str, Any]) -> RulesResult:
+    """Grade the students in the parsed *inputs* (as returned by
+    :func:`course_tools.input.parse_inputs`, along with their kinds) using
+    the rules in *rules_filename*, timing each hook in :data:`HOOK_NAMES`.
+
+    :arg limits: keyword arguments to :func:`course_tools.query.apply_limits`.
+    """
+    from . import input as inp, query as qry
+    from .data import Database
+    from .grade import grade_students
+    from .rules import load_course_rules
+
+    course_rules = load_course_rules(rules_filename)
+    get_scale = course_rules["GET_SCALE"]
+
+    database = Database(course_rules)
+    for kind, rows in inputs:
+        inp.merge_input(database, kind, rows)
+
+    database = qry.apply_limits(database, **limits)
+
+    timings = {}
+    for name in HOOK_NAMES:
+        if name in course_rules:
+            timings[name] = HookTiming()
+            course_rules[name] = _make_timed(course_rules[name], timings[name])
+
+    start = time.perf_counter()
+    grade_students(database)
+    total_seconds = time.perf_counter() - start
+
+    return RulesResult(
+        students={
+            netid: StudentResult(
+                grade=student.grade,
+                rounded_grade=student.rounded_grade,
+                letter_grade=student.letter_grade,
+                scale=get_scale(student))
+            for netid, student in database.students.items()},
+        timings=timings,
+        total_seconds=total_seconds)
+
+# }}}
+
+
+# {{{ comparison
+
+def _grades_differ(a: float | None, b: float | None) -> bool:
+    if a is None or b is None:
+        return a is not b
+    return not math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-12)
+
+
+def get_result_differences(
+        baseline: Mapping[str, StudentResult],
+        candidate: Mapping[str, StudentResult]) -> list[tuple[str, list[str]]]:
+    """
+    :returns: a sorted list of tuples of network ID and descriptions of the
+        differences for that student.
+    """
+    result = []
+    for netid in sorted(baseline.keys() | candidate.keys()):
+        base = baseline.get(netid)
+        cand = candidate.get(netid)
+        if base is None:
+            result.append((netid, ["only graded by candidate"]))
+            continue
+        if cand is None:
+            result.append((netid, ["only graded by baseline"]))
+            continue
+
+        diffs = []
+        if _grades_differ(base.grade, cand.grade):
+            diffs.append("grade %s -> %s"
+                         % (format_frac(base.grade), format_frac(cand.grade)))
+        if base.rounded_grade != cand.rounded_grade:
+            diffs.append("rounded %s -> %s"
+                         % (base.rounded_grade, cand.rounded_grade))
+        if base.letter_grade != cand.letter_grade:
+            diffs.append("letter %s -> %s" % (base.letter_grade, cand.letter_grade))
+        if base.scale != cand.scale:
+            diffs.append("scale %s -> %s" % (base.scale, cand.scale))
+
+        if diffs:
+            result.append((netid, diffs))
+
+    return result
+
+
+def compare_rules(
+        baseline_rules: str,
+        candidate_rules: str,
+        inputs: Sequence[tuple[InputKind, str]],
+        limits: Mapping[str, Any] | None = None,
+        nworkers: int | None = None,
+        cache_dir: str | None = None) -> tuple[RulesResult, RulesResult]:
+    """Parse *inputs* once (using the parsed-input cache in *cache_dir*, if
+    given) and evaluate *baseline_rules* and *candidate_rules* on them in
+    parallel.
+    """
+    from . import input as inp
+
+    if limits is None:
+        limits = {}
+
+    parsed: list[tuple[InputKind, list[Any]]] = list(zip(
+        [kind for kind, _filename in inputs],
+        inp.parse_inputs(inputs, nworkers, cache_dir=cache_dir),
+        strict=True))
+
+    if nworkers == 1:
+        # rows end up in the students, whose course rules may modify them
+        from copy import deepcopy
+        return (
+            evaluate_rules(baseline_rules, deepcopy(parsed), limits),
+            evaluate_rules(candidate_rules, parsed, limits))
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(2) as pool:
+        baseline_future = pool.submit(evaluate_rules, baseline_rules, parsed, limits)
+        candidate_future = pool.submit(
+            evaluate_rules, candidate_rules, parsed, limits)
+        return baseline_future.result(), candidate_future.result()
+
+
+def print_rules_comparison(baseline: RulesResult, candidate: RulesResult) -> None:
+    differences = get_result_differences(baseline.students, candidate.students)
+
+    print("-"*75)
+    print("DIFFERENCES (%d of %d students)"
+          % (len(differences), len(baseline.students.keys()
+                                   | candidate.students.keys())))
+    print("-"*75)
+    for netid, diffs in differences:
+        print("%s: %s" % (netid, ", ".join(diffs)))
+
+    def format_timing(timing: HookTiming | None) -> str:
+        if timing is None:
+            return "%-31s" % "-"
+        us_per_call = 1e6*timing.seconds/timing.ncalls if timing.ncalls else 0
+        return "%7d calls %9.1f us/call" % (timing.ncalls, us_per_call)
+
+    print("-"*75)
+    print("%-21s %-31s %-31s" % ("TIMING", "baseline", "candidate"))
+    print("-"*75)
+    for name in HOOK_NAMES:
+        base = baseline.timings.get(name)
+        cand = candidate.timings.get(name)
+        if base is None and cand is None:
+            continue
+
+        ratio = ""
+        if base is not None and cand is not None and base.seconds:
+            ratio = "x%.2f" % (cand.seconds / base.seconds)
+        print("%-21s %s %s %s"
+              % (name, format_timing(base), format_timing(cand), ratio))
+
+    ratio = ""
+    if baseline.total_seconds:
+        ratio = "x%.2f" % (candidate.total_seconds / baseline.total_seconds)
+    print("%-21s %-31s %-31s %s"
+          % ("total grading",
+             "%.1f ms" % (1e3*baseline.total_seconds),
+             "%.1f ms" % (1e3*candidate.total_seconds),
+             ratio))
+
+# }}}
+
+# vim: foldmethod=marker
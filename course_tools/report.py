@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Any, Literal
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+    from course_tools.data import Database, Student
+
+
+from .files import write_atomically
+from .grade_tools import format_frac
+
+
+ReportFormat = Literal["txt", "html", "json"]
+
+REPORT_FORMATS: Sequence[ReportFormat] = ("txt", "html", "json")
+
+
+# {{{ rendering
+
+def get_student_report_data(database: Database, student: Student) -> dict[str, Any]:
+    """Return the contents of a student report as plain, picklable data."""
+    assert database.course_rules is not None
+    assert student.network_id is not None
+
+    return {
+        "network_id": student.network_id,
+        "last_name": student.last_name,
+        "first_name": student.first_name,
+        "university_id": student.university_id,
+        "section": student.section,
+        "credit_hours": student.credit_hours,
+        "standing": student.standing,
+        "scale": database.course_rules["GET_SCALE"](student),
+        "log": [
+            [entry.severity, entry.message]
+            for entry in database.diagnostics.get_for_student(student.network_id)],
+        "grade": student.grade,
+        "rounded_grade": student.rounded_grade,
+        "letter_grade": student.letter_grade,
+        }
+
+
+def render_student_report_text(
+        data: dict[str, Any],
+        highlight: Callable[[str], str] | None = None) -> str:
+    lines = [
+        "-"*75,
+        "%s, %s (%s)" % (data["last_name"], data["first_name"], data["network_id"]),
+        "-"*75,
+        "UIN: %s" % data["university_id"],
+        "Section: %s" % data["section"],
+        f"Credit hours: {data['credit_hours']}",
+        "Standing: %s" % data["standing"],
+        "Scale: %s" % data["scale"],
+        ]
+
+    for severity, ln in data["log"]:
+        if severity >= 4:
+            ln = "/!\\ " + ln
+            if highlight is not None:
+                ln = highlight(ln)
+
+        lines.append(ln)
+
+    lines.extend([
+        "-"*75,
+        "Grade: %s" % format_frac(data["grade"]),
+        "Rounded grade: %s" % data["rounded_grade"],
+        "Letter grade: %s" % data["letter_grade"],
+        "-"*75,
+        ])
+
+    return "\n".join(lines) + "\n"
+
+
+def render_student_report_html(data: dict[str, Any]) -> str:
+    from html import escape
+
+    def row(name: str, value: Any) -> str:
+        return f"<tr><th>{escape(name)}</th><td>{escape(str(value))}</td></tr>"
+
+    log_items = "\n".join(
+        '<li class="warning">%s</li>' % escape(msg) if severity >= 4
+        else "<li>%s</li>" % escape(msg)
+        for severity, msg in data["log"])
+
+    title = escape("%s, %s (%s)" % (
+        data["last_name"], data["first_name"], data["network_id"]))
+
+    return "\n".join([
+        "<!DOCTYPE html>",
+        '<html><head><meta charset="utf-8">',
+        f"<title>{title}</title>",
+        "<style>.warning { color: #b00; font-weight: bold; }</style>",
+        "</head><body>",
+        f"<h1>{title}</h1>",
+        "<table>",
+        row("UIN", data["university_id"]),
+        row("Section", data["section"]),
+        row("Credit hours", data["credit_hours"]),
+        row("Standing", data["standing"]),
+        row("Scale", data["scale"]),
+        "</table>",
+        f"<ul>\n{log_items}\n</ul>",
+        "<table>",
+        row("Grade", format_frac(data["grade"])),
+        row("Rounded grade", data["rounded_grade"]),
+        row("Letter grade", data["letter_grade"]),
+        "</table>",
+        "</body></html>",
+        ]) + "\n"
+
+
+def render_student_report(data: dict[str, Any], fmt: ReportFormat) -> str:
+    if fmt == "txt":
+        return render_student_report_text(data)
+    elif fmt == "html":
+        return render_student_report_html(data)
+    elif fmt == "json":
+        return json.dumps(data, indent=1) + "\n"
+    else:
+        raise ValueError(f"unknown report format: '{fmt}'")
+
+# }}}
+
+
+# {{{ batch generation
+
+def _write_student_report(
+        item: tuple[dict[str, Any], ReportFormat, str, str | None]
+        ) -> tuple[str, str, bool]:
+    data, fmt, filename, old_digest = item
+
+    contents = render_student_report(data, fmt)
+    digest = hashlib.blake2b(contents.encode("utf-8"), digest_size=16).hexdigest()
+
+    if digest == old_digest and os.path.exists(filename):
+        return data["network_id"], digest, False
+
+    write_atomically(filename, contents)
+    return data["network_id"], digest, True
+
+
+def write_student_reports(
+        database: Database,
+        output_dir: str,
+        fmt: ReportFormat = "txt",
+        nprocs: int | None = None,
+        prune: bool = False) -> tuple[int, int, int]:
+    """Write one report per student in *database* to
+    ``<output_dir>/<network_id>.<fmt>``, rendering in *nprocs* worker
+    processes. Digests of the written reports are kept in *output_dir*, and
+    reports whose contents have not changed since the last run are not
+    rewritten. Reports of other students, e.g. ones outside of a section
+    filter, are left alone.
+
+    :arg prune: if *True*, remove reports written by earlier runs for
+        students not in *database*.
+
+    :returns: a tuple of the number of reports written, unchanged and removed.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"unknown report format: '{fmt}'")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    digest_filename = os.path.join(output_dir, f".report-digests-{fmt}.json")
+    try:
+        with open(digest_filename, encoding="utf-8") as inf:
+            old_digests: dict[str, str] = json.load(inf)
+    except (OSError, ValueError):
+        old_digests = {}
+
+    items: list[tuple[dict[str, Any], ReportFormat, str, str | None]] = [
+        (get_student_report_data(database, student),
+            fmt,
+            os.path.join(output_dir, f"{netid}.{fmt}"),
+            old_digests.get(netid))
+        for netid, student in sorted(database.students.items())]
+
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+
+    if nprocs <= 1 or len(items) < 2:
+        results = list(map(_write_student_report, items))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=nprocs) as pool:
+            results = list(pool.map(
+                _write_student_report, items,
+                chunksize=max(1, len(items) // (4*nprocs))))
+
+    new_digests = dict(old_digests)
+    nwritten = 0
+    for netid, digest, written in results:
+        new_digests[netid] = digest
+        nwritten += written
+
+    nremoved = 0
+    if prune:
+        for netid in old_digests.keys() - database.students.keys():
+            del new_digests[netid]
+            try:
+                os.unlink(os.path.join(output_dir, f"{netid}.{fmt}"))
+            except FileNotFoundError:
+                pass
+            else:
+                nremoved += 1
+
+    write_atomically(digest_filename, json.dumps(new_digests, sort_keys=True))
+
+    return nwritten, len(results) - nwritten, nremoved
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from course_tools.data import Database
+
+
+from .files import write_atomically
+
+
+ROSTER_SNAPSHOT_FORMAT_VERSION = 1
+
+
+# {{{ normalized roster
+
+@dataclass(frozen=True)
+class RosterEntry:
+    university_id: str | None
+    last_name: str | None
+    first_name: str | None
+    section: str | None
+    standing: str | None
+    credit_hours: int | None
+
+
+_FIELDS = (
+    "university_id", "last_name", "first_name",
+    "section", "standing", "credit_hours")
+
+
+def roster_from_database(database: Database) -> dict[str, RosterEntry]:
+    """Build a normalized roster from the students in *database* that are on
+    the roster, i.e. have a university ID.
+    """
+    return {
+        netid: RosterEntry(**{fld: getattr(student, fld) for fld in _FIELDS})
+        for netid, student in database.students.items()
+        if student.university_id}
+
+# }}}
+
+
+# {{{ deltas
+
+@dataclass
+class RosterDelta:
+    added: list[str] = field(default_factory=list)
+    dropped: list[str] = field(default_factory=list)
+    # (network ID, old value, new value)
+    section_changes: list[tuple[str, Any, Any]] = field(default_factory=list)
+    standing_changes: list[tuple[str, Any, Any]] = field(default_factory=list)
+    credit_hours_changes: list[tuple[str, Any, Any]] = field(default_factory=list)
+    # any other change, e.g. of name or UIN
+    other_changes: list[str] = field(default_factory=list)
+
+    @property
+    def affected(self) -> set[str]:
+        """Network IDs of all students whose roster entry changed."""
+        return {
+            *self.added, *self.dropped, *self.other_changes,
+            *(netid for netid, _old, _new in self.section_changes),
+            *(netid for netid, _old, _new in self.standing_changes),
+            *(netid for netid, _old, _new in self.credit_hours_changes),
+            }
+
+    def __bool__(self) -> bool:
+        return bool(self.affected)
+
+
+def compute_roster_delta(
+        old: Mapping[str, RosterEntry],
+        new: Mapping[str, RosterEntry]) -> RosterDelta:
+    delta = RosterDelta()
+
+    for netid, new_entry in new.items():
+        old_entry = old.get(netid)
+        if old_entry is None:
+            delta.added.append(netid)
+            continue
+
+        if old_entry == new_entry:
+            continue
+
+        changed = False
+        if old_entry.section != new_entry.section:
+            delta.section_changes.append(
+                (netid, old_entry.section, new_entry.section))
+            changed = True
+        if old_entry.standing != new_entry.standing:
+            delta.standing_changes.append(
+                (netid, old_entry.standing, new_entry.standing))
+            changed = True
+        if old_entry.credit_hours != new_entry.credit_hours:
+            delta.credit_hours_changes.append(
+                (netid, old_entry.credit_hours, new_entry.credit_hours))
+            changed = True
+        if not changed:
+            delta.other_changes.append(netid)
+
+    delta.dropped.extend(netid for netid in old if netid not in new)
+
+    for changes in [
+            delta.added, delta.dropped, delta.section_changes,
+            delta.standing_changes, delta.credit_hours_changes,
+            delta.other_changes]:
+        changes.sort()
+
+    return delta
+
+
+def print_roster_delta(delta: RosterDelta, new: Mapping[str, RosterEntry]) -> None:
+    def print_heading(title: str, count: int) -> None:
+        print("-"*75)
+        print("%s (%d)" % (title, count))
+        print("-"*75)
+
+    if delta.added:
+        print_heading("ADDED", len(delta.added))
+        for netid in delta.added:
+            entry = new[netid]
+            print("%s: %s, %s (Section %s)" % (
+                netid, entry.last_name, entry.first_name, entry.section))
+
+    if delta.dropped:
+        print_heading("DROPPED", len(delta.dropped))
+        for netid in delta.dropped:
+            print(netid)
+
+    for title, changes in [
+            ("SECTION CHANGES", delta.section_changes),
+            ("STANDING CHANGES", delta.standing_changes),
+            ("CREDIT HOUR CHANGES", delta.credit_hours_changes),
+            ]:
+        if changes:
+            print_heading(title, len(changes))
+            for netid, old_value, new_value in changes:
+                print("%s: %s -> %s" % (netid, old_value, new_value))
+
+    if delta.other_changes:
+        print_heading("OTHER CHANGES", len(delta.other_changes))
+        for netid in delta.other_changes:
+            print(netid)
+
+    if not delta:
+        print("no roster changes")
+
+
+# }}}
+
+
+# {{{ snapshot store
+
+class RosterSnapshotStore:
+    """Keeps the most recently ingested normalized roster in a JSON file."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    def load(self) -> dict[str, RosterEntry]:
+        try:
+            with open(self.filename, encoding="utf-8") as inf:
+                data = json.load(inf)
+        except FileNotFoundError:
+            return {}
+
+        if data.get("version") != ROSTER_SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                "unsupported roster snapshot version in '%s': %s"
+                % (self.filename, data.get("version")))
+
+        fields = data["fields"]
+        return {
+            netid: RosterEntry(**dict(zip(fields, values, strict=True)))
+            for netid, values in data["students"].items()}
+
+    def save(self, roster: Mapping[str, RosterEntry]) -> None:
+        write_atomically(self.filename, json.dumps({
+            "version": ROSTER_SNAPSHOT_FORMAT_VERSION,
+            "fields": _FIELDS,
+            "students": {
+                netid: [getattr(entry, fld) for fld in _FIELDS]
+                for netid, entry in sorted(roster.items())},
+            }, separators=(",", ":")))
+
+    def ingest(self, roster: Mapping[str, RosterEntry]) -> RosterDelta:
+        """Compare *roster* with the stored one, store *roster* in its place
+        and return the changes.
+
+        :raises ValueError: if *roster* is empty but the stored one is not,
+            which almost always means that no roster was read.
+        """
+        old = self.load()
+        if old and not roster:
+            raise ValueError(
+                "refusing to replace the roster in '%s' with an empty one"
+                % self.filename)
+
+        delta = compute_roster_delta(old, roster)
+        if delta:
+            self.save(roster)
+        return delta
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from types import CodeType
+
+
+from .files import get_cache_dir, write_cache_file
+
+
+def compile_course_rules(filename: str) -> CodeType:
+    """Compile the course rules file *filename*, reusing previously compiled
+    bytecode from a cache keyed by the file's contents if possible.
+    """
+    source = Path(filename).read_bytes()
+
+    key = hashlib.sha256()
+    key.update(sys.implementation.cache_tag.encode())
+    key.update(b"\0")
+    key.update(os.fsencode(filename))
+    key.update(b"\0")
+    key.update(source)
+
+    cache_file = get_cache_dir("rules") / f"{key.hexdigest()}.bin"
+
+    try:
+        return marshal.loads(cache_file.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    code = compile(source, filename, "exec")
+
+    write_cache_file(cache_file, marshal.dumps(code))
+
+    return code
+
+
+def load_course_rules(filename: str) -> dict[str, Any]:
+    course_rules: dict[str, Any] = {}
+    exec(compile_course_rules(filename), course_rules)  # ruff:ignore[exec-builtin]
+    return course_rules
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, TextIO, cast
+
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from course_tools.data import Database, Student
+
+
+from .grade import CLOSE_CALL_TEMPLATE
+from .grade_tools import format_frac
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+# {{{ snapshot entries
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    grade: float | None
+    rounded_grade: int | None
+    letter_grade: str | None
+    scale: str | None
+    log_digest: str
+    input_fingerprint: str
+    close_calls: tuple[str, ...]
+
+
+_FIELDS = (
+    "grade", "rounded_grade", "letter_grade", "scale",
+    "log_digest", "input_fingerprint", "close_calls")
+
+
+def _digest(data: str) -> str:
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _input_fingerprint(student: Student) -> str:
+    return _digest(repr((
+        student.university_id,
+        student.section,
+        student.standing,
+        student.credit_hours,
+        sorted(student.csv_row.items()),
+        sorted(student.roster_row.items()),
+        )))
+
+
+def make_snapshot_entry(database: Database, student: Student) -> SnapshotEntry:
+    assert database.course_rules is not None
+
+    assert student.network_id is not None
+
+    log = database.diagnostics.get_for_student(student.network_id)
+    return SnapshotEntry(
+        grade=student.grade,
+        rounded_grade=student.rounded_grade,
+        letter_grade=student.letter_grade,
+        scale=database.course_rules["GET_SCALE"](student),
+        log_digest=_digest(repr([(entry.severity, entry.message) for entry in log])),
+        input_fingerprint=_input_fingerprint(student),
+        # letters whose cutoff the student narrowly missed
+        close_calls=tuple(
+            entry.args[0] for entry in log
+            if entry.template == CLOSE_CALL_TEMPLATE))
+
+
+def make_snapshot(database: Database) -> dict[str, SnapshotEntry]:
+    return {
+        netid: make_snapshot_entry(database, student)
+        for netid, student in database.students.items()}
+
+# }}}
+
+
+# {{{ reading/writing
+
+def _open(filename: str, mode: str) -> TextIO:
+    if filename.endswith(".gz"):
+        import gzip
+        return cast("TextIO", gzip.open(filename, mode + "t", encoding="utf-8"))
+    else:
+        return cast("TextIO", open(filename, mode, encoding="utf-8"))
+
+
+def write_snapshot(database: Database, filename: str) -> None:
+    """Write a compact summary of the grading results in *database* to
+    *filename* as JSON. The file is gzip-compressed if *filename* ends
+    in ``.gz``.
+    """
+    snapshot = make_snapshot(database)
+
+    with _open(filename, "w") as outf:
+        json.dump({
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "fields": _FIELDS,
+            "students": {
+                netid: [getattr(entry, fld) for fld in _FIELDS]
+                for netid, entry in sorted(snapshot.items())},
+            }, outf, separators=(",", ":"))
+
+
+def read_snapshot(filename: str) -> dict[str, SnapshotEntry]:
+    with _open(filename, "r") as inf:
+        data = json.load(inf)
+
+    if data.get("version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            "unsupported snapshot version in '%s': %s"
+            % (filename, data.get("version")))
+
+    fields = data["fields"]
+    result = {}
+    for netid, values in data["students"].items():
+        kwargs: dict[str, Any] = dict(zip(fields, values, strict=True))
+        kwargs["close_calls"] = tuple(kwargs["close_calls"])
+        result[netid] = SnapshotEntry(**kwargs)
+
+    return result
+
+# }}}
+
+
+# {{{ diffing
+
+# in order of presentation
+CHANGE_KINDS = (
+    "added",
+    "removed",
+    "letter",
+    "rounded_grade",
+    "grade",
+    "scale",
+    "new_close_call",
+    )
+
+
+@dataclass(frozen=True)
+class SnapshotChange:
+    kind: str
+    network_id: str
+    old: SnapshotEntry | None
+    new: SnapshotEntry | None
+
+    @property
+    def reasons(self) -> list[str]:
+        if self.old is None or self.new is None:
+            return []
+
+        result = []
+        if self.old.input_fingerprint != self.new.input_fingerprint:
+            result.append("inputs changed")
+        if self.old.scale != self.new.scale:
+            result.append("scale changed")
+        if self.old.log_digest != self.new.log_digest:
+            result.append("log changed")
+        return result
+
+
+def diff_snapshots(
+        old: Mapping[str, SnapshotEntry],
+        new: Mapping[str, SnapshotEntry]
+        ) -> dict[str, list[SnapshotChange]]:
+    """Return a mapping from each kind in :data:`CHANGE_KINDS` to a list of
+    changes of that kind, sorted by network ID. A student may show up under
+    more than one kind, e.g. with a letter change and a new close call, but
+    under at most one of ``letter``, ``rounded_grade`` and ``grade``.
+    """
+    result: dict[str, list[SnapshotChange]] = {kind: [] for kind in CHANGE_KINDS}
+
+    def add(kind: str, netid: str,
+            old_entry: SnapshotEntry | None, new_entry: SnapshotEntry | None):
+        result[kind].append(SnapshotChange(kind, netid, old_entry, new_entry))
+
+    for netid, new_entry in new.items():
+        old_entry = old.get(netid)
+        if old_entry is None:
+            add("added", netid, None, new_entry)
+            continue
+
+        if old_entry == new_entry:
+            continue
+
+        if old_entry.letter_grade != new_entry.letter_grade:
+            add("letter", netid, old_entry, new_entry)
+        elif old_entry.rounded_grade != new_entry.rounded_grade:
+            add("rounded_grade", netid, old_entry, new_entry)
+        elif old_entry.grade != new_entry.grade:
+            add("grade", netid, old_entry, new_entry)
+
+        if old_entry.scale != new_entry.scale:
+            add("scale", netid, old_entry, new_entry)
+
+        if not set(new_entry.close_calls) <= set(old_entry.close_calls):
+            add("new_close_call", netid, old_entry, new_entry)
+
+    for netid, old_entry in old.items():
+        if netid not in new:
+            add("removed", netid, old_entry, None)
+
+    for changes in result.values():
+        changes.sort(key=lambda change: change.network_id)
+
+    return result
+
+
+def _format_grade(entry: SnapshotEntry) -> str:
+    return "%s/%s/%s" % (
+        format_frac(entry.grade), entry.rounded_grade, entry.letter_grade)
+
+
+def _format_change(change: SnapshotChange) -> str:
+    old, new = change.old, change.new
+    if old is None:
+        assert new is not None
+        return "%s: %s" % (change.network_id, _format_grade(new))
+    if new is None:
+        return "%s: %s" % (change.network_id, _format_grade(old))
+
+    if change.kind == "scale":
+        detail = "%s -> %s" % (old.scale, new.scale)
+    elif change.kind == "new_close_call":
+        detail = "%s (now: %s)" % (
+            ", ".join(cc for cc in new.close_calls if cc not in old.close_calls),
+            _format_grade(new))
+    else:
+        detail = "%s -> %s" % (_format_grade(old), _format_grade(new))
+
+    reasons = change.reasons
+    if reasons:
+        detail = "%s [%s]" % (detail, ", ".join(reasons))
+
+    return "%s: %s" % (change.network_id, detail)
+
+
+def print_snapshot_diff(
+        old: Mapping[str, SnapshotEntry],
+        new: Mapping[str, SnapshotEntry]) -> None:
+    diff = diff_snapshots(old, new)
+
+    for kind in CHANGE_KINDS:
+        changes = diff[kind]
+        if not changes:
+            continue
+
+        print("-"*75)
+        print("%s (%d)" % (kind.upper().replace("_", " "), len(changes)))
+        print("-"*75)
+        for change in changes:
+            print(_format_change(change))
+
+    if not any(diff.values()):
+        print("no changes")
+
+# }}}
+
+# vim: foldmethod=marker